@@ -14,10 +14,31 @@ Created 24/05/2023
 
 Requires: Raspberry Pi Pico W with Micropython
 """
-import network
+import os
 import socket
 import time
-import ujson
+try:
+    import ujson
+except ImportError:
+    import json as ujson
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    import network
+except ImportError:
+    # Not on a Pico W: serve locally so the server can be run and
+    # load-tested with CPython (with PIICODEV_SIM=1 for the sensor)
+    network = None
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(t1, t0):
+        return t1 - t0
 from PiicoDev_BME280 import PiicoDev_BME280
 
 __author__ = "Sam Rogers"
@@ -29,6 +50,402 @@ DEFAULT_WIFI = {
     "pwd": "1qaz7ujm",
 }
 
+# Default time between sensor conversions shared by all clients
+DEFAULT_SAMPLE_MS = 250
+
+# Most clients kept open on /stream at once
+MAX_STREAM_CLIENTS = 4
+SLOW_CLIENT_S = 0.5  # longest wait for a stream client to take an update
+STREAM_BACKLOG = 1024  # most bytes queued for a stream client (CPython)
+
+# Longest wait in seconds for a client's request line, and then for
+# the rest of its request
+READ_TIMEOUT = 5
+
+# Longest wait in seconds for the next request on a kept-alive connection
+KEEP_ALIVE_S = 5
+
+# Most requests served on one connection before it is closed
+MAX_REQUESTS = 100
+
+# Most header lines read from one request
+MAX_HEADERS = 32
+
+# Content type of the plain text readings
+TEXT = "text/plain; charset=utf-8"
+
+
+class Sampler:
+    """
+    Shares one BME280 conversion between every request made within an
+    interval, so sensor reads do not grow with the number of clients.
+
+    :ivar atmo: an object representation of the sensor
+    :ivar zero: the initial altitude of the sensor on startup
+    :ivar interval_ms: the minimum time in milliseconds between conversions
+    :ivar reading: a dictionary of the latest readings, None before the
+                   first sample
+    :ivar json: the latest readings encoded as a JSON document
+    """
+    def __init__(self, atmo: PiicoDev_BME280, zero: float,
+                 interval_ms: int = DEFAULT_SAMPLE_MS):
+        """
+        Initialises the sampler. No conversion is made until first read.
+        """
+        self.atmo = atmo
+        self.zero = zero
+        self.interval_ms = interval_ms
+        self.reading = None
+        self.json = None
+        self.taken = 0
+
+    def read(self) -> dict:
+        """
+        Get the latest readings, taking a new sample if the last one is
+        older than the interval.
+
+        :return: temperature (C), pressure (hPa), humidity (%RH) and
+                 altitude relative to startup (m); None if unavailable
+        """
+        now = ticks_ms()
+        if self.reading is None or \
+                ticks_diff(now, self.taken) >= self.interval_ms:
+            sample = self.atmo.sample()
+            self.reading = {
+                "temp": _value(sample.temperature),
+                "press": _value(sample.pressure / 100),
+                "humid": _value(sample.humidity),
+                "alt": _value(sample.altitude - self.zero),
+            }
+            self.json = ujson.dumps(self.reading)
+            self.taken = now
+        return self.reading
+
+    def read_json(self) -> str:
+        """
+        Get the latest readings as a JSON document.
+
+        :return: the readings encoded as JSON
+        """
+        self.read()
+        return self.json
+
+
+def _value(x: float):
+    """
+    Round a reading for display, mapping a failed (NaN) reading to None.
+    """
+    return round(x, 2) if x == x else None
+
+
+def _readout(name: str, value, unit: str) -> str:
+    """
+    Format a reading for a text response.
+
+    :param name: the label for the reading
+    :param value: the reading from the sampler, None if it failed
+    :param unit: the unit appended to the reading
+    :return: the label and reading, or "NO READING" if it failed
+    """
+    if value is None:
+        return name + ": NO READING"
+    return name + ": " + "%.2f" % value + unit
+
+
+class EventStream:
+    """
+    Clients subscribed to /stream. Each is kept open and pushed the
+    readings as a text/event-stream update at the sampler's rate.
+
+    :ivar sampler: the shared sampler for the sensor
+    :ivar max_clients: the most clients subscribed at once
+    :ivar clients: an array of the subscribed client stream writers
+    :ivar sending: the clients still taking their last update
+    """
+    def __init__(self, sampler: Sampler,
+                 max_clients: int = MAX_STREAM_CLIENTS):
+        """
+        Initialises an empty event stream.
+        """
+        self.sampler = sampler
+        self.max_clients = max_clients
+        self.clients = []
+        self.sending = []
+
+    async def subscribe(self, writer):
+        """
+        Stream to a client until it is dropped, unless the stream is full.
+
+        :param writer: the client's stream writer
+        """
+        if len(self.clients) >= self.max_clients:
+            send_response(writer, b"", status="503 Service Unavailable")
+            await writer.drain()  # before the connection is closed
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\n\r\n"
+                     b"retry: 1000\n\n")
+        writer.write(self._event())
+        await writer.drain()
+        transport = getattr(writer, "transport", None)
+        if transport is not None:
+            # CPython queues 64 KB, and the OS far more, before drain()
+            # waits; keep it to a few updates so a stalled client is seen
+            transport.set_write_buffer_limits(STREAM_BACKLOG)
+            writer.get_extra_info("socket").setsockopt(
+                socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_BACKLOG)
+        self.clients.append(writer)
+        while writer in self.clients:
+            await asyncio.sleep(1)
+
+    async def publish(self):
+        """
+        Push the latest readings to every client, each in its own task so
+        a slow client does not hold up the others. A client still taking
+        its last update is skipped.
+        """
+        if not self.clients:
+            return
+        event = self._event()
+        for writer in self.clients:
+            if writer not in self.sending:
+                self.sending.append(writer)
+                asyncio.create_task(self._send(writer, event))
+
+    async def _send(self, writer, event: bytes):
+        """
+        Send an update to a client. The client is dropped if it has gone
+        away, or does not take the update within SLOW_CLIENT_S.
+        """
+        try:
+            writer.write(event)
+            await asyncio.wait_for(writer.drain(), SLOW_CLIENT_S)
+        except Exception:
+            if writer in self.clients:
+                self.clients.remove(writer)
+        self.sending.remove(writer)
+
+    def _event(self) -> bytes:
+        """
+        Get the latest readings as one text/event-stream update.
+        """
+        return ("data: " + self.sampler.read_json() + "\n\n").encode()
+
+
+async def sample_readings(sampler: Sampler, stream: EventStream):
+    """
+    Sampling task: take a new sample every interval, so requests are
+    served from memory, and push it to /stream clients.
+
+    :param sampler: the shared sampler for the sensor
+    :param stream: the clients subscribed to /stream
+    """
+    while True:
+        sampler.read()
+        await stream.publish()
+        await asyncio.sleep(sampler.interval_ms / 1000)
+
+
+class HTTPError(Exception):
+    """
+    A request that is answered with an error status, then the connection
+    closed. The argument is the status code and reason.
+    """
+
+
+async def read_request(reader, timeout: float = READ_TIMEOUT) -> tuple:
+    """
+    Read a client's request line and headers, and discard any body, so
+    the next request on the connection starts at its request line. Gives
+    up if the request line takes longer than the timeout, or the rest of
+    the request READ_TIMEOUT.
+
+    :param reader: the client's stream reader
+    :param timeout: the longest wait in seconds for the request line
+    :return: the request line, empty if the client sent nothing, and
+             whether the client wants the connection kept open
+    :raises ValueError: if the request is not UTF-8 or its Content-Length
+                        is not a number
+    :raises HTTPError: if the rest of the request is too slow, or has more
+                       than MAX_HEADERS headers
+    """
+    request = await asyncio.wait_for(reader.readline(), timeout)
+    if not request:
+        return "", False
+    # HTTP/1.1 connections persist unless closed, HTTP/1.0 ones must ask
+    try:
+        keep_alive = await asyncio.wait_for(
+            _read_headers(reader, b"HTTP/1.1" in request), READ_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPError("408 Request Timeout")
+    return request.decode("utf-8"), keep_alive
+
+
+async def _read_headers(reader, keep_alive: bool) -> bool:
+    """
+    Read the headers of a request and discard its body.
+
+    :param reader: the client's stream reader
+    :param keep_alive: whether the request line keeps the connection open
+    :return: whether the client wants the connection kept open
+    """
+    length = 0
+    for i in range(MAX_HEADERS + 1):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        header = line[:18].lower()
+        if header[:11] == b"connection:":
+            value = line.lower()
+            keep_alive = b"keep-alive" in value or \
+                (keep_alive and b"close" not in value)
+        elif header[:15] == b"content-length:":
+            length = int(line[15:].decode())
+            if length < 0:
+                raise ValueError("negative Content-Length")
+        elif header == b"transfer-encoding:":
+            length = -1
+    else:
+        raise HTTPError("431 Request Header Fields Too Large")
+    if length < 0:
+        # The end of the body is unknown, so the connection cannot be reused
+        keep_alive = False
+    while length > 0:
+        chunk = await reader.read(min(length, 512))
+        if not chunk:
+            break
+        length -= len(chunk)
+    return keep_alive
+
+
+def response_head(content_type: str, length: int, keep_alive: bool,
+                  status: str = "200 OK") -> bytes:
+    """
+    Build the status line and headers of an HTTP/1.1 response.
+
+    :param content_type: the MIME type of the body
+    :param length: the length of the body in bytes
+    :param keep_alive: whether the connection stays open afterwards
+    :param status: the response status code and reason
+    :return: the encoded response head
+    """
+    return ("HTTP/1.1 " + status +
+            "\r\nContent-Type: " + content_type +
+            "\r\nContent-Length: " + str(length) +
+            ("\r\nConnection: keep-alive\r\nKeep-Alive: timeout=" +
+             str(KEEP_ALIVE_S) if keep_alive else "\r\nConnection: close") +
+            "\r\n\r\n").encode()
+
+
+def send_response(writer, body: bytes, content_type: str = "text/html",
+                  keep_alive: bool = False, status: str = "200 OK"):
+    """
+    Write a complete response, so the client can tell where it ends and
+    reuse the connection.
+
+    :param writer: the client's stream writer
+    :param body: the encoded response body
+    :param content_type: the MIME type of the body
+    :param keep_alive: whether the connection stays open afterwards
+    :param status: the response status code and reason
+    """
+    writer.write(response_head(content_type, len(body), keep_alive, status))
+    writer.write(body)
+
+
+async def send_error(writer, status: str):
+    """
+    Answer a request that cannot be served, before the connection is
+    closed.
+
+    :param writer: the client's stream writer
+    :param status: the response status code and reason
+    """
+    try:
+        send_response(writer, status.encode(), "text/plain", status=status)
+        await writer.drain()
+    except OSError:
+        pass
+
+
+class Template:
+    """
+    An HTML page held in memory, pre-split around its placeholder into
+    encoded chunks, so each response is sent as the chunks with the value
+    between them, with no file read or string copy. The page is reloaded
+    when the file's size or modification time changes.
+
+    :ivar path: the path of the template file
+    :ivar placeholder: the text replaced by the value in each response
+    :ivar chunks: the encoded pieces of the page around each placeholder
+    :ivar size: the total length of the chunks in bytes
+    :ivar stamp: the size and modification time of the loaded file
+    """
+    def __init__(self, path: str, placeholder: str):
+        """
+        Initialises the template, loading the page from the file.
+        """
+        self.path = path
+        self.placeholder = placeholder
+        self.chunks = []
+        self.size = 0
+        self.stamp = None
+        self.load()
+
+    def load(self):
+        """
+        Load the page again if the file has changed since it was loaded.
+        """
+        stat = os.stat(self.path)
+        stamp = (stat[6], stat[8])
+        if stamp == self.stamp:
+            return
+        with open(self.path) as f:
+            self.chunks = [chunk.encode()
+                           for chunk in f.read().split(self.placeholder)]
+        self.size = sum(len(chunk) for chunk in self.chunks)
+        self.stamp = stamp
+
+    def send(self, writer, value: str, keep_alive: bool = False):
+        """
+        Write the page as a complete response, with the value in place of
+        each placeholder.
+
+        :param writer: the client's stream writer
+        :param value: the text to fill the placeholders with
+        :param keep_alive: whether the connection stays open afterwards
+        """
+        self.load()
+        value = value.encode()
+        writer.write(response_head(
+            "text/html", self.size + len(value) * (len(self.chunks) - 1),
+            keep_alive))
+        writer.write(self.chunks[0])
+        for chunk in self.chunks[1:]:
+            writer.write(value)
+            writer.write(chunk)
+
+
+async def send_file(writer, path: str, content_type: str,
+                    keep_alive: bool = False):
+    """
+    Stream a file to the client in 1 KiB chunks as a complete response.
+
+    :param writer: the client's stream writer
+    :param path: the file to send
+    :param content_type: the MIME type of the file
+    :param keep_alive: whether the connection stays open afterwards
+    """
+    writer.write(response_head(content_type, os.stat(path)[6], keep_alive))
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(1024)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+
 
 def connect_to_wifi(ssid, pwd):
     """
@@ -77,73 +494,95 @@ def connect_to_wifi(ssid, pwd):
         print("  DNS Server:\t", status[3])
 
 
-def atmo_control_server(atmo: PiicoDev_BME280, zero: float):
+async def atmo_control_server(sampler: Sampler, port: int = 80):
     """
     Creates a simple HTTP server for controlling and retrieving data
-    from the PiicoDev BME280 Atmospheric Sensor.
+    from the PiicoDev BME280 Atmospheric Sensor. Each client is served
+    in its own task, and the sensor is sampled by another.
 
-    :param atmo: an object representation of the sensor
-    :param zero: the initial altitude of the sensor on startup
+    :param sampler: the shared sampler for the sensor
+    :param port: the port to listen on
     :return:
     """
-    # Listen for connections on port 80 (HTTP Server Port)
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    sock = socket.socket()
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind(addr)
-    sock.listen()
-    print("Listening....")
+    stream = EventStream(sampler)
+    page = Template("index.html", "**READING**")
 
-    # Listen for connections, respond to client requests
-    while True:
+    async def handle_client(reader, writer):
+        """
+        Respond to each of a client's requests, until it closes the
+        connection, it is idle for KEEP_ALIVE_S or it has made
+        MAX_REQUESTS requests.
+        """
         try:
-            # Accept client connections and print requests to console.
-            cl, addr = sock.accept()
-            print("Client connected from: ", addr)
-            request = cl.recv(1024).decode("utf-8")
-            print(request)
-
-            # Request processing
-            request_url = request.split()[1]
-            if request_url == "/temp":
-                # Client requests temperature data
-                temp = "%.2f" % atmo.values()[0]
-                cl.send("TEMP: " + temp + chr(176) + "C")
-            elif request_url == "/press":
-                # Client requests pressure data
-                press = "%.2f" % (atmo.values()[1] / 100)
-                cl.send("PRESS: " + press + "hPa")
-            elif request_url == "/humid":
-                # Client requests relative humidity data
-                humid = "%.2f" % atmo.values()[2]
-                cl.send("HUM: " + humid + "%RH")
-            elif request_url == "/alt":
-                # Client requests current altitude
-                alt = "%.2f" % (atmo.altitude() - zero)
-                cl.send("ALT: " + alt + "m")
-            elif request_url == "/favicon.ico":
-                # Client wants the favicon
-                cl.send("HTTP/1.1 200 OK\r\nContent-type: image/png\r\n\r\n")
-                with open("icon.png", "rb") as f:
-                    while True:
-                        data = f.read(1024)
-                        if not data:
-                            break
-                        cl.sendall(data)
-            else:
-                # Client wants the default page
-                with open("index.html") as f:
-                    html = f.read()
-                    html = html.replace("**READING**", "Please select an "
-                                                       "option to begin")
-                    cl.send(html)
-            cl.close()
-        except OSError:
-            # Client loses connection to server.
+            # Print client requests to console.
+            print("Client connected from: ", writer.get_extra_info("peername"))
+            timeout = READ_TIMEOUT
+            for served in range(1, MAX_REQUESTS + 1):
+                request, keep_alive = await read_request(reader, timeout)
+                if not request:
+                    break
+                print(request)
+                keep_alive = keep_alive and served < MAX_REQUESTS
+
+                # Request processing
+                request_url = request.split()[1]
+                if request_url == "/stream":
+                    # Client subscribes to live readings, until dropped
+                    await stream.subscribe(writer)
+                    break
+                elif request_url == "/data":
+                    # Client requests all readings
+                    send_response(writer, sampler.read_json().encode(),
+                                  "application/json", keep_alive)
+                elif request_url == "/temp":
+                    # Client requests temperature data
+                    readout = _readout("TEMP", sampler.read()["temp"],
+                                       chr(176) + "C")
+                    send_response(writer, readout.encode(), TEXT, keep_alive)
+                elif request_url == "/press":
+                    # Client requests pressure data
+                    readout = _readout("PRESS", sampler.read()["press"], "hPa")
+                    send_response(writer, readout.encode(), TEXT, keep_alive)
+                elif request_url == "/humid":
+                    # Client requests relative humidity data
+                    readout = _readout("HUM", sampler.read()["humid"], "%RH")
+                    send_response(writer, readout.encode(), TEXT, keep_alive)
+                elif request_url == "/alt":
+                    # Client requests current altitude
+                    readout = _readout("ALT", sampler.read()["alt"], "m")
+                    send_response(writer, readout.encode(), TEXT, keep_alive)
+                elif request_url == "/favicon.ico":
+                    # Client wants the favicon
+                    await send_file(writer, "icon.png", "image/png", keep_alive)
+                else:
+                    # Client wants the default page
+                    page.send(writer, "Please select an option to begin",
+                              keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+                timeout = KEEP_ALIVE_S
+        except HTTPError as e:
+            await send_error(writer, e.args[0])
+        except (OSError, asyncio.TimeoutError):
+            # Client loses connection to server, or is too slow.
             print('Connection Closed')
-        except IndexError:
-            # Empty request
-            pass
+        except (IndexError, ValueError):
+            # Malformed request line, encoding or header
+            await send_error(writer, "400 Bad Request")
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    # Listen for connections on port 80 (HTTP Server Port)
+    await asyncio.start_server(handle_client, "0.0.0.0", port)
+    print("Listening....")
+    asyncio.create_task(sample_readings(sampler, stream))
+    while True:
+        await asyncio.sleep(3600)
 
 
 def main():
@@ -153,15 +592,19 @@ def main():
     Load Wi-Fi configuration from config file, connect to specified
     network, initialise PiicoDev sensor, get initial altitude of sensor
     and create a simple HTTP server to control the sensor and display
-    data output.
+    data output. Off the Pico W, the server runs on port 8080 for local
+    testing.
     """
     with open("config.json", "r") as f:
         cfg = ujson.load(f)
-    connect_to_wifi(cfg.get("ssid", DEFAULT_WIFI["ssid"]),
-                    cfg.get("pwd", DEFAULT_WIFI["pwd"]))
-    atmo = PiicoDev_BME280()
+    if network is not None:
+        connect_to_wifi(cfg.get("ssid", DEFAULT_WIFI["ssid"]),
+                        cfg.get("pwd", DEFAULT_WIFI["pwd"]))
+    atmo = PiicoDev_BME280(t_sb=0, max_age_ms=100)  # Sample continuously
     zero = atmo.altitude()
-    atmo_control_server(atmo, zero)
+    sampler = Sampler(atmo, zero, cfg.get("sample_ms", DEFAULT_SAMPLE_MS))
+    asyncio.run(atmo_control_server(sampler,
+                                    80 if network is not None else 8080))
 
 
 if __name__ == '__main__':
@@ -14,6 +14,8 @@ Created 24/05/2023
 
 Requires: Raspberry Pi Pico W with Micropython
 """
+import time
+import uasyncio
 import ujson
 from phew import server, connect_to_wifi
 from phew.template import render_template
@@ -28,9 +30,225 @@ DEFAULT_WIFI = {
     "pwd": "1qaz7ujm",
 }
 
+# Default time between sensor conversions shared by all clients
+DEFAULT_SAMPLE_MS = 250
+
+# Live readings are streamed from a second port, alongside phew on port 80
+STREAM_PORT = 8080
+MAX_STREAM_CLIENTS = 4
+SLOW_CLIENT_S = 0.5  # longest wait for a client to take an update
+READ_TIMEOUT = 5  # longest wait in seconds for a whole request
+MAX_HEADERS = 32  # most header lines read from one request
+
+
+class Sampler:
+    """
+    Shares one BME280 conversion between every request made within an
+    interval, so sensor reads do not grow with the number of clients.
+
+    :ivar atmo: an object representation of the sensor
+    :ivar zero: the initial altitude of the sensor on startup
+    :ivar interval_ms: the minimum time in milliseconds between conversions
+    :ivar reading: a dictionary of the latest readings, None before the
+                   first sample
+    :ivar json: the latest readings encoded as a JSON document
+    """
+    def __init__(self, atmo: PiicoDev_BME280, zero: float,
+                 interval_ms: int = DEFAULT_SAMPLE_MS):
+        """
+        Initialises the sampler. No conversion is made until first read.
+        """
+        self.atmo = atmo
+        self.zero = zero
+        self.interval_ms = interval_ms
+        self.reading = None
+        self.json = None
+        self.taken = 0
+
+    def read(self) -> dict:
+        """
+        Get the latest readings, taking a new sample if the last one is
+        older than the interval.
+
+        :return: temperature (C), pressure (hPa), humidity (%RH) and
+                 altitude relative to startup (m); None if unavailable
+        """
+        now = time.ticks_ms()
+        if self.reading is None or \
+                time.ticks_diff(now, self.taken) >= self.interval_ms:
+            sample = self.atmo.sample()
+            self.reading = {
+                "temp": _value(sample.temperature),
+                "press": _value(sample.pressure / 100),
+                "humid": _value(sample.humidity),
+                "alt": _value(sample.altitude - self.zero),
+            }
+            self.json = ujson.dumps(self.reading)
+            self.taken = now
+        return self.reading
+
+    def read_json(self) -> str:
+        """
+        Get the latest readings as a JSON document.
+
+        :return: the readings encoded as JSON
+        """
+        self.read()
+        return self.json
+
+
+def _value(x: float):
+    """
+    Round a reading for display, mapping a failed (NaN) reading to None.
+    """
+    return round(x, 2) if x == x else None
+
+
+def _readout(name: str, value, unit: str) -> str:
+    """
+    Format a reading for a text response.
+
+    :param name: the label for the reading
+    :param value: the reading from the sampler, None if it failed
+    :param unit: the unit appended to the reading
+    :return: the label and reading, or "NO READING" if it failed
+    """
+    if value is None:
+        return name + ": NO READING"
+    return name + ": " + "%.2f" % value + unit
+
+
+class EventStream:
+    """
+    Clients subscribed to the stream port. Each is kept open and pushed
+    the readings as a text/event-stream update at the sampler's rate.
+
+    :ivar sampler: the shared sampler for the sensor
+    :ivar max_clients: the most clients subscribed at once
+    :ivar clients: an array of the subscribed client stream writers
+    :ivar sending: the clients still taking their last update
+    """
+    def __init__(self, sampler: Sampler,
+                 max_clients: int = MAX_STREAM_CLIENTS):
+        """
+        Initialises an empty event stream.
+        """
+        self.sampler = sampler
+        self.max_clients = max_clients
+        self.clients = []
+        self.sending = []
+
+    async def serve(self, reader, writer):
+        """
+        Handle a connection to the stream port. The request is read and
+        ignored, answering 408 if it takes longer than READ_TIMEOUT or 431
+        if it has more than MAX_HEADERS headers; the client is streamed to
+        until it is dropped.
+
+        :param reader: the client's stream reader
+        :param writer: the client's stream writer
+        """
+        try:
+            try:
+                error = None if await uasyncio.wait_for(
+                    self._skip_request(reader), READ_TIMEOUT) else \
+                    b"431 Request Header Fields Too Large"
+            except uasyncio.TimeoutError:
+                error = b"408 Request Timeout"
+            if error:
+                writer.write(b"HTTP/1.1 " + error + b"\r\n\r\n")
+                await writer.drain()
+            elif len(self.clients) >= self.max_clients:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\n"
+                             b"Access-Control-Allow-Origin: *\r\n\r\n")
+                await writer.drain()
+            else:
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/event-stream\r\n"
+                             b"Cache-Control: no-cache\r\n"
+                             b"Access-Control-Allow-Origin: *\r\n\r\n"
+                             b"retry: 1000\n\n")
+                writer.write(self._event())
+                await writer.drain()
+                self.clients.append(writer)
+                while writer in self.clients:
+                    await uasyncio.sleep(1)
+        except OSError:
+            # Client loses connection
+            pass
+        finally:
+            if writer in self.clients:
+                self.clients.remove(writer)
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _skip_request(self, reader) -> bool:
+        """
+        Read a request line and its headers.
+
+        :return: False if there are more than MAX_HEADERS headers
+        """
+        for i in range(MAX_HEADERS + 2):
+            if await reader.readline() in (b"\r\n", b"\n", b""):
+                return True
+        return False
+
+    async def publish(self):
+        """
+        Push the latest readings to every client at the sampler's rate,
+        each in its own task so a slow client does not hold up the others.
+        A client still taking its last update is skipped.
+        """
+        while True:
+            await uasyncio.sleep(self.sampler.interval_ms / 1000)
+            if not self.clients:
+                continue
+            event = self._event()
+            for writer in self.clients:
+                if writer not in self.sending:
+                    self.sending.append(writer)
+                    uasyncio.create_task(self._send(writer, event))
+
+    async def _send(self, writer, event: bytes):
+        """
+        Send an update to a client. The client is dropped if it has gone
+        away, or does not take the update within SLOW_CLIENT_S.
+        """
+        try:
+            writer.write(event)
+            await uasyncio.wait_for(writer.drain(), SLOW_CLIENT_S)
+        except Exception:
+            if writer in self.clients:
+                self.clients.remove(writer)
+        self.sending.remove(writer)
+
+    def _event(self) -> bytes:
+        """
+        Get the latest readings as one text/event-stream update.
+        """
+        return ("data: " + self.sampler.read_json() + "\n\n").encode()
+
+
 # Initialise sensor
-atmo = PiicoDev_BME280()
+atmo = PiicoDev_BME280(t_sb=0, max_age_ms=100)  # Sample continuously
 zero = atmo.altitude()
+sampler = Sampler(atmo, zero)
+stream = EventStream(sampler)
+
+
+@server.route("/data")
+def data(request):
+    """
+    Get all current readings from the BME280 as one JSON document.
+
+    :param request: an object representation of the HTTP request
+    :return: the readings, served from the shared sampler
+    """
+    return server.Response(sampler.read_json(),
+                           headers={"Content-Type": "application/json"})
 
 
 @server.route("/temp")
@@ -41,7 +259,7 @@ def temperature(request):
     :param request: an object representation of the HTTP request
     :return: a message with the current temperature in degrees Celsius
     """
-    return "TEMP: %.2f\xb0C" % atmo.values()[0]
+    return _readout("TEMP", sampler.read()["temp"], "\xb0C")
 
 
 @server.route("/press")
@@ -52,7 +270,7 @@ def pressure(request):
     :param request: an object representation of the HTTP request
     :return: a message with the current pressure in hectopascals
     """
-    return "PRESS: %.2fhPa" % (atmo.values()[1] / 100)
+    return _readout("PRESS", sampler.read()["press"], "hPa")
 
 
 @server.route("/humid")
@@ -63,7 +281,7 @@ def relative_humidity(request):
     :param request: an object representation of the HTTP request
     :return: a message with the current relative humidity
     """
-    return "HUM: %.2f%%RH" % atmo.values()[2]
+    return _readout("HUM", sampler.read()["humid"], "%RH")
 
 
 @server.route("/alt")
@@ -74,7 +292,7 @@ def altitude(request):
     :param request: an object representation of the HTTP request
     :return: a message with the current altitude
     """
-    return "ALT: %.2fm" % (atmo.altitude() - zero)
+    return _readout("ALT", sampler.read()["alt"], "m")
 
 
 @server.route("/favicon.ico")
@@ -116,9 +334,14 @@ def main():
     """
     with open("config.json", "r") as f:
         cfg = ujson.load(f)
+    sampler.interval_ms = cfg.get("sample_ms", DEFAULT_SAMPLE_MS)
     wifi = connect_to_wifi(cfg.get("ssid", DEFAULT_WIFI["ssid"]),
                            cfg.get("pwd", DEFAULT_WIFI["pwd"]))
     print("Wi-Fi Connected!\nIP: " + wifi)
+    loop = uasyncio.get_event_loop()
+    loop.create_task(uasyncio.start_server(stream.serve, "0.0.0.0",
+                                           STREAM_PORT))
+    loop.create_task(stream.publish())
     server.run()
 
 
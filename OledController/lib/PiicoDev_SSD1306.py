@@ -33,7 +33,8 @@ WIDTH = 128
 HEIGHT = 64
 
 from PiicoDev_Unified import *
-from math import cos,sin,radians
+from math import sin,radians
+from array import array
 
 compat_str = '\nUnified PiicoDev library out of date.  Get the latest module: https://piico.dev/unified \n'
 
@@ -42,38 +43,40 @@ _SYSNAME = os.uname().sysname
 if _SYSNAME == 'microbit':
     from microbit import *
     from utime import sleep_ms
-    from ustruct import pack_into
+    _start_thread = None
 elif _SYSNAME == 'Linux':
-    from struct import pack_into
+    from threading import Thread
+
+    def _start_thread(fn):
+        Thread(target=fn, daemon=True).start()
 else:
     import framebuf
+    try:
+        from _thread import start_new_thread
+
+        def _start_thread(fn):
+            start_new_thread(fn, ())  # runs on the second core of the RP2040
+    except ImportError:
+        _start_thread = None
     
 if _SYSNAME == 'microbit' or _SYSNAME == 'Linux':
     class framebuf:
         class FrameBuffer():
                 #Framebuffer manipulation, used by Microbit and Linux
-            def _set_pos(self, col=0, page=0):
-                self.write_cmd(0xb0 | page)  # page number
-                # take upper and lower value of col * 2
-                c1, c2 = col * 2 & 0x0F, col >> 3
-                self.write_cmd(0x00 | c1)  # lower start column address
-                self.write_cmd(0x10 | c2)  # upper start column address
-                
+            # Drawing only touches self.buffer; show() transfers it to the display
             def fill(self, c=0):
-                for i in range(0, 1024):
-                    if c > 0:
-                        self.buffer[i] = 0xFF
+                self.buffer[:] = _PAGE[1 if c else 0] * (HEIGHT // 8)
+
+            def pixel(self, x, y, color=None):
+                # Out-of-range pixels are ignored, as framebuf does
+                if 0 <= x < WIDTH and 0 <= y < HEIGHT:
+                    ind = x + (y >> 3) * WIDTH
+                    if color is None:
+                        return (self.buffer[ind] >> (y & 7)) & 1
+                    if color:
+                        self.buffer[ind] |= 1 << (y & 7)
                     else:
-                        self.buffer[i] = 0x00
-                        
-            def pixel(self, x, y, color):
-                x = x & (WIDTH - 1)
-                y = y & (HEIGHT - 1)
-                page, shift_page = divmod(y, 8)
-                ind = x + page * 128
-                b = self.buffer[ind] | (1 << shift_page) if color else self.buffer[ind] & ~ (1 << shift_page)
-                pack_into(">B", self.buffer, ind, b)
-                self._set_pos(x, page)
+                        self.buffer[ind] &= ~(1 << (y & 7))
 
             def line(self, x1, y1, x2, y2, c):
                 # bresenham
@@ -119,45 +122,159 @@ if _SYSNAME == 'microbit' or _SYSNAME == 'Linux':
                         err += dx
                     x1 += 1        
          
-            def hline(self, x, y, l, c):
-                self.line(x, y, x + l, y, c)
-                
+            def hline(self, x, y, w, c):
+                self.fill_rect(x, y, w, 1, c)
+
             def vline(self, x, y, h, c):
-                self.line(x, y, x, y + h, c)
-                
-            def rect(self, x, y, w, h, c):
-                self.hline(x, y, w, c)
-                self.hline(x, y+h, w, c)
-                self.vline(x, y, h, c)
-                self.vline(x+w, y, h, c)
-                          
+                self.fill_rect(x, y, 1, h, c)
+
+            def rect(self, x, y, w, h, c, f=False):
+                if f:
+                    self.fill_rect(x, y, w, h, c)
+                    return
+                self.fill_rect(x, y, w, 1, c)
+                self.fill_rect(x, y + h - 1, w, 1, c)
+                self.fill_rect(x, y, 1, h, c)
+                self.fill_rect(x + w - 1, y, 1, h, c)
+
             def fill_rect(self, x, y, w, h, c):
-                for i in range(y, y + h):
-                    self.hline(x, i, w, c)
-                    
+                # Clipped like framebuf. Whole page bytes are set with one slice
+                # assignment; partly covered pages are masked byte by byte.
+                x0, x1 = max(x, 0), min(x + w, WIDTH)
+                y0, y1 = max(y, 0), min(y + h, HEIGHT)
+                if x0 >= x1 or y0 >= y1:
+                    return
+                buf = self.buffer
+                span = _PAGE[1 if c else 0][:x1 - x0]
+                for page in range(y0 >> 3, ((y1 - 1) >> 3) + 1):
+                    o = page * WIDTH
+                    mask = (0xFF << max(y0 - page * 8, 0)) & (0xFF >> max(page * 8 + 8 - y1, 0))
+                    if mask == 0xFF:
+                        buf[o + x0:o + x1] = span
+                    elif c:
+                        for i in range(o + x0, o + x1):
+                            buf[i] |= mask
+                    else:
+                        mask ^= 0xFF
+                        for i in range(o + x0, o + x1):
+                            buf[i] &= mask
+
             def text(self, text, x, y, c=1):
-                fontFile = open("font-pet-me-128.dat", "rb")
-                font = bytearray(fontFile.read())
+                # Blit glyph columns straight into the page buffer: one page when y is
+                # page-aligned, otherwise merged across two pages. Only rows 0-6 are drawn.
+                font = _font()
+                buf = self.buffer
+                page, shift = divmod(y, 8)
+                pages = HEIGHT // 8
+                lo = page * WIDTH if 0 <= page < pages else -1
+                hi = (page + 1) * WIDTH if shift and 0 <= page + 1 < pages else -1
                 for text_index in range(0, len(text)):
-                     ind = 0
-                     for col in range(8):
-                        fontDataPixelValues = font[(ord(text[text_index])-32)*8 + col]
-                        #ind = text_index * 8 + x * 8 + y * 128 + col
-                        for i in range(0,7):
-                            if fontDataPixelValues & 1 << i != 0:
-                                x_coordinate = x + col + text_index * 8
-                                y_coordinate = y+i
-                                if x_coordinate < WIDTH and y_coordinate < HEIGHT:
-                                    self.pixel(x_coordinate, y_coordinate, c)
+                    g = (ord(text[text_index]) - 32) * 8
+                    if g < 0 or g >= len(font):
+                        continue # no glyph, leave blank
+                    for col in range(8):
+                        x_coordinate = x + col + text_index * 8
+                        if x_coordinate < 0 or x_coordinate >= WIDTH:
+                            continue
+                        bits = (font[g + col] & 0x7F) << shift
+                        if c:
+                            if lo >= 0:
+                                buf[lo + x_coordinate] |= bits & 0xFF
+                            if hi >= 0:
+                                buf[hi + x_coordinate] |= bits >> 8
+                        else:
+                            if lo >= 0:
+                                buf[lo + x_coordinate] &= ~bits & 0xFF
+                            if hi >= 0:
+                                buf[hi + x_coordinate] &= ~(bits >> 8) & 0xFF
+
+            def scroll(self, xstep, ystep):
+                # As framebuf: vacated rows/columns keep their old contents.
+                # Whole-page vertical steps copy page slices, others shift each column.
+                if abs(xstep) >= WIDTH or abs(ystep) >= HEIGHT:
+                    return
+                buf = self.buffer
+                pages = HEIGHT // 8
+                x0, x1 = max(0, xstep), WIDTH + min(0, xstep)
+                if ystep % 8 == 0:
+                    dp = ystep // 8
+                    for p in (range(pages - 1, dp - 1, -1) if dp > 0 else range(pages + dp)):
+                        buf[p * WIDTH + x0:p * WIDTH + x1] = buf[(p - dp) * WIDTH + x0 - xstep:(p - dp) * WIDTH + x1 - xstep]
+                    return
+                full = (1 << HEIGHT) - 1
+                move = (full << ystep) & full if ystep > 0 else full >> -ystep
+                for x in (range(x1 - 1, x0 - 1, -1) if xstep > 0 else range(x0, x1)):
+                    col = src = 0
+                    for p in range(pages):
+                        col |= buf[p * WIDTH + x] << (8 * p)
+                        src |= buf[p * WIDTH + x - xstep] << (8 * p)
+                    src = src << ystep if ystep > 0 else src >> -ystep
+                    col = (col & ~move) | (src & move)
+                    for p in range(pages):
+                        buf[p * WIDTH + x] = (col >> (8 * p)) & 0xFF
+
+    _PAGE = (bytes(WIDTH), b'\xff' * WIDTH)
+    _font_data = None
+
+    def _font():
+        # Font is read from flash once per process
+        global _font_data
+        if _font_data is None:
+            with open("font-pet-me-128.dat", "rb") as f:
+                _font_data = f.read()
+        return _font_data
     
     
+_pbm_table = None
+
+def _pbm_to_pages(data):
+    # Row-major PBM rows to vertical page bytes. Each PBM byte is looked up as the
+    # 8 column bytes of its 8x8 block (one bit each), and the block's 8 rows are
+    # merged with shifts on the whole page row as one integer.
+    global _pbm_table
+    if _pbm_table is None:
+        _pbm_table = [bytes([(v >> (7-j)) & 1 for j in range(8)]) for v in range(256)]
+    row_bytes = WIDTH // 8
+    n = row_bytes * HEIGHT
+    data = bytes(data[:n])
+    data += bytes(n - len(data))  # a short file is padded blank; MicroPython has no bytes.ljust
+    pages = bytearray()
+    for page in range(HEIGHT // 8):
+        acc = 0
+        for r in range(8):
+            o = (page*8 + r) * row_bytes
+            acc |= int.from_bytes(b''.join([_pbm_table[v] for v in data[o:o+row_bytes]]), 'little') << r
+        cols = acc.to_bytes(WIDTH, 'little')
+        pages += cols[-1:] + cols[:-1]  # same placement as the previous per-pixel loader
+    return pages
+
+_SIN = array('h', [round(sin(radians(a)) * 16384) for a in range(91)])
+
+def _sin_q14(a):
+    # sin(a degrees) * 16384 from a quarter-wave table
+    a %= 360
+    if a <= 90:
+        return _SIN[a]
+    if a <= 180:
+        return _SIN[180-a]
+    if a <= 270:
+        return -_SIN[a-180]
+    return -_SIN[360-a]
+
 class PiicoDev_SSD1306(framebuf.FrameBuffer):
     def init_display(self):
         self.width = WIDTH
         self.height = HEIGHT
         self.pages = HEIGHT // 8
         self.buffer = bytearray(self.pages * WIDTH)
-        for cmd in (
+        self._mv = memoryview(self.buffer)
+        # Dirty column span per page; x0 > x1 means the page is clean
+        self._dirty_x0 = bytearray([WIDTH] * self.pages)
+        self._dirty_x1 = bytearray(self.pages)
+        self._full = True  # display RAM contents unknown until the first full frame
+        self._win = bytearray([_SET_COL_ADDR, 0, WIDTH - 1, _SET_PAGE_ADDR, 0, self.pages - 1])
+        self._go = None  # set when frames are flushed in the background
+        self.write_cmds((
             _SET_DISP,  # display off
             # address setting
             _SET_MEM_ADDR,
@@ -190,8 +307,7 @@ class PiicoDev_SSD1306(framebuf.FrameBuffer):
             _SET_CHARGE_PUMP,
             0x14,
             _SET_DISP | 0x01,  # display on
-        ):  # on
-            self.write_cmd(cmd)
+        ))
 
     def poweroff(self):
         self.write_cmd(_SET_DISP)
@@ -200,30 +316,194 @@ class PiicoDev_SSD1306(framebuf.FrameBuffer):
         self.write_cmd(_SET_DISP | 0x01)
 
     def setContrast(self, contrast):
-        self.write_cmd(_SET_CONTRAST)
-        self.write_cmd(contrast)
+        self.write_cmds((_SET_CONTRAST, contrast))
 
     def invert(self, invert):
         self.write_cmd(_SET_NORM_INV | (invert & 1))
 
     def rotate(self, rotate):
-        self.write_cmd(_SET_COM_OUT_DIR | ((rotate & 1) << 3))
-        self.write_cmd(_SET_SEG_REMAP | (rotate & 1))
-
-    def show(self):
-        x0 = 0
-        x1 = WIDTH - 1
-        self.write_cmd(_SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(_SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
+        self.write_cmds((_SET_COM_OUT_DIR | ((rotate & 1) << 3), _SET_SEG_REMAP | (rotate & 1)))
+
+    def _mark(self, x0, y0, x1, y1):
+        # Widen the dirty span of every page touched by the rectangle. All bounds are
+        # inclusive: a w x h area at x, y is _mark(x, y, x + w - 1, y + h - 1)
+        if x0 > x1:
+            x0, x1 = x1, x0
+        if y0 > y1:
+            y0, y1 = y1, y0
+        if x1 < 0 or x0 >= WIDTH or y1 < 0 or y0 >= HEIGHT:
+            return
+        x0 = 0 if x0 < 0 else x0
+        x1 = WIDTH - 1 if x1 >= WIDTH else x1
+        y0 = 0 if y0 < 0 else y0
+        y1 = HEIGHT - 1 if y1 >= HEIGHT else y1
+        d0 = self._dirty_x0
+        d1 = self._dirty_x1
+        for p in range(y0 >> 3, (y1 >> 3) + 1):
+            if x0 < d0[p]:
+                d0[p] = x0
+            if x1 > d1[p]:
+                d1[p] = x1
+
+    def fill(self, c=0):
+        super().fill(c)
+        self._full = True
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        super().pixel(x, y, c)
+        self._mark(x, y, x, y)
+
+    def hline(self, x, y, w, c):
+        super().hline(x, y, w, c)
+        if w > 0:
+            self._mark(x, y, x + w - 1, y)
+
+    def vline(self, x, y, h, c):
+        super().vline(x, y, h, c)
+        if h > 0:
+            self._mark(x, y, x, y + h - 1)
+
+    def line(self, x1, y1, x2, y2, c):
+        super().line(x1, y1, x2, y2, c)
+        self._mark(x1, y1, x2, y2)
+
+    def rect(self, x, y, w, h, c, *f):
+        super().rect(x, y, w, h, c, *f)
+        if w > 0 and h > 0:
+            self._mark(x, y, x + w - 1, y + h - 1)
+
+    def fill_rect(self, x, y, w, h, c):
+        super().fill_rect(x, y, w, h, c)
+        if w > 0 and h > 0:
+            self._mark(x, y, x + w - 1, y + h - 1)
+
+    def text(self, s, x, y, c=1):
+        super().text(s, x, y, c)
+        self._mark(x, y, x + 8 * len(s) - 1, y + 7)
+
+    def scroll(self, xstep, ystep):
+        super().scroll(xstep, ystep)
+        self._full = True
+
+    def blit(self, fbuf, x, y, *args):
+        super().blit(fbuf, x, y, *args)
+        self._full = True
+
+    def ellipse(self, x, y, xr, yr, c, *args):
+        # MicroPython framebuf only
+        super().ellipse(x, y, xr, yr, c, *args)
+        self._mark(x - xr, y - yr, x + xr, y + yr)
+
+    def poly(self, x, y, coords, c, *args):
+        # MicroPython framebuf only
+        super().poly(x, y, coords, c, *args)
+        if len(coords) >= 2:
+            xs = coords[0::2]
+            ys = coords[1::2]
+            self._mark(x + min(xs), y + min(ys), x + max(xs), y + max(ys))
+
+    def show(self, force_full=False):
+        # Only what was drawn through the methods above is tracked; after writing to
+        # self.buffer directly, call show(force_full=True) to send the whole frame
+        if self._go is None:
+            self._send(self._mv, self._dirty_x0, self._dirty_x1, force_full or self._full)
+        else:
+            # Double buffered: copy the frame and its dirty spans for the flusher
+            self._idle.acquire()  # previous frame still going out
+            self._front[:] = self.buffer
+            self._front_x0[:] = self._dirty_x0
+            self._front_x1[:] = self._dirty_x1
+            self._front_full = force_full or self._full
+            self._go.release()
+        self._full = False
+        for p in range(self.pages):
+            self._dirty_x0[p] = WIDTH
+            self._dirty_x1[p] = 0
+
+    def wait(self):
+        # Block until the last frame handed to the flusher has been sent
+        if self._go is not None:
+            self._idle.acquire()
+            self._idle.release()
+
+    def _start_flusher(self):
+        if _start_thread is None or Lock is None:
+            return  # no threads on this port, show() stays synchronous
+        self._front = bytearray(len(self.buffer))
+        self._front_mv = memoryview(self._front)
+        self._front_x0 = bytearray(self.pages)
+        self._front_x1 = bytearray(self.pages)
+        self._front_full = True
+        self._stop = False
+        self._idle = Lock()
+        self._go = Lock()
+        self._go.acquire()
+        _start_thread(self._flusher)
+
+    def stop_flusher(self):
+        # Send the frame in flight, then end the flusher thread; show() is synchronous after
+        if self._go is None:
+            return
+        self._idle.acquire()
+        self._stop = True
+        self._go.release()
+        self._idle.acquire()  # released by the flusher as it exits
+        self._idle.release()
+        self._go = None
+
+    def _flusher(self):
+        # Runs until stop_flusher(). A failing on_frame callback is reported and skipped
+        while True:
+            self._go.acquire()
+            if self._stop:
+                self._idle.release()
+                return
+            try:
+                self._send(self._front_mv, self._front_x0, self._front_x1, self._front_full)
+            finally:
+                self._idle.release()
+            if self.on_frame is not None:
+                try:
+                    self.on_frame()
+                except Exception as e:
+                    print('SSD1306 on_frame callback failed:', repr(e))
+
+    def _send(self, mv, d0, d1, full):
+        if full:
+            self._window(0, WIDTH - 1, 0, self.pages - 1)
+            self.write_data(mv)
+        else:
+            # Consecutive dirty pages share one window spanning the union of their columns
+            p = 0
+            while p < self.pages:
+                if d0[p] > d1[p]:
+                    p += 1
+                    continue
+                x0, x1 = d0[p], d1[p]
+                q = p
+                while q + 1 < self.pages and d0[q + 1] <= d1[q + 1]:
+                    q += 1
+                    x0 = min(x0, d0[q])
+                    x1 = max(x1, d1[q])
+                self._window(x0, x1, p, q)
+                for page in range(p, q + 1):
+                    self.write_data(mv[page * WIDTH + x0:page * WIDTH + x1 + 1])
+                p = q + 1
+
+    def _window(self, x0, x1, p0, p1):
+        win = self._win
+        win[1], win[2], win[4], win[5] = x0, x1, p0, p1
+        self.write_cmds(win)
         
     def write_cmd(self, cmd):
+        self.write_cmds((cmd,))
+
+    def write_cmds(self, cmds):
+        # A whole command list in one transaction: control byte 0x00 (Co=0, D/C#=0)
         try:
-            self.i2c.writeto_mem(self.addr, int.from_bytes(b'\x80','big'), bytes([cmd]))
+            self.i2c.writeto_mem(self.addr, 0x00, cmds if isinstance(cmds, bytearray) else bytes(cmds))
             self.comms_err = False
         except:
             print(i2c_err_str.format(self.addr))
@@ -239,103 +519,200 @@ class PiicoDev_SSD1306(framebuf.FrameBuffer):
             self.comms_err = True
             
     def circ(self,x,y,r,t=1,c=1):
-        for i in range(x-r,x+r+1):
-            for j in range(y-r,y+r+1):
-                if t==1:
-                    if((i-x)**2 + (j-y)**2 < r**2):
-                        self.pixel(i,j,1)
+        # Fills the ring r-r*t-1 <= d < r one row at a time. The outer and inner
+        # edges are walked inwards as the row moves out (midpoint style, no sqrt),
+        # and each row is drawn as one or two hline spans.
+        r2 = r*r
+        i2 = -1 if t==1 else (r-r*t-1)**2
+        wo = wi = r
+        for dy in range(r):
+            while wo >= 0 and wo*wo >= r2 - dy*dy:
+                wo -= 1
+            while wi >= 0 and wi*wi >= i2 - dy*dy:
+                wi -= 1
+            if wo < 0:
+                break
+            for yy in ((y,) if dy == 0 else (y-dy, y+dy)):
+                if wi < 0:
+                    self.hline(x-wo, yy, 2*wo+1, c)
                 else:
-                    if((i-x)**2 + (j-y)**2 < r**2) and ((i-x)**2 + (j-y)**2 >= (r-r*t-1)**2):
-                        self.pixel(i,j,c)
-                   
+                    self.hline(x-wo, yy, wo-wi, c)
+                    self.hline(x+wi+1, yy, wo-wi, c)
+
     def arc(self,x,y,r,stAng,enAng,t=0,c=1):
-        for i in range(r*(1-t)-1,r):
+        # Points come from the Q14 sine table; repeated points on small rings are skipped
+        for i in range(int(r*(1-t))-1,r):
+            lx = ly = None
             for ta in range(stAng,enAng,1):
-                X = int(i*cos(radians(ta))+ x)
-                Y = int(i*sin(radians(ta))+ y)
-                self.pixel(X,Y,c)
-            
-    def load_pbm(self, filename, c):
-        with open(filename, 'rb') as f:
-            line = f.readline()
-            if line.startswith(b'P4') is False:
-                print('Not a valid pbm P4 file')
-                return
-            line = f.readline()
-            while line.startswith(b'#') is True:
+                X = x + ((i*_sin_q14(ta+90)) >> 14)
+                Y = y + ((i*_sin_q14(ta)) >> 14)
+                if X != lx or Y != ly:
+                    self.pixel(X,Y,c)
+                    lx, ly = X, Y
+
+    def load_pbm(self, filename, c, cache=False):
+        # With cache=True the converted page bytes are kept in a .bin file next to
+        # the image, stamped with the image's size and mtime
+        bin_name = filename.rsplit('.', 1)[0] + '.bin'
+        image = None
+        if cache:
+            st = os.stat(filename)
+            stamp = '{} {}\n'.format(st[6], st[8]).encode()
+            try:
+                with open(bin_name, 'rb') as f:
+                    if f.readline() == stamp:  # image size and mtime unchanged
+                        image = f.read()
+            except OSError:
+                pass  # no cache yet, or unreadable: convert the image
+            if image is not None and len(image) != len(self.buffer):
+                image = None  # cut short, convert again
+        if image is None:
+            with open(filename, 'rb') as f:
                 line = f.readline()
-            data_piicodev = bytearray(f.read())
-        for byte in range(WIDTH // 8 * HEIGHT):
-            for bit in range(8):
-                if data_piicodev[byte] & 1 << bit != 0:
-                    x_coordinate = ((8-bit) + (byte * 8)) % WIDTH
-                    y_coordinate = byte * 8 // WIDTH
-                    if x_coordinate < WIDTH and y_coordinate < HEIGHT:
-                        self.pixel(x_coordinate, y_coordinate, c)
-                        
+                if line.startswith(b'P4') is False:
+                    print('Not a valid pbm P4 file')
+                    return
+                line = f.readline()
+                while line.startswith(b'#') is True:
+                    line = f.readline()
+                image = _pbm_to_pages(f.read())
+            if cache:
+                try:
+                    with open(bin_name, 'wb') as f:
+                        f.write(stamp)
+                        f.write(image)
+                except OSError:
+                    print('Could not write ' + bin_name)
+        buf = int.from_bytes(self.buffer, 'little')
+        img = int.from_bytes(image, 'little')
+        buf = buf | img if c else buf ^ (buf & img)
+        self.buffer[:] = buf.to_bytes(len(self.buffer), 'little')
+        self._full = True
+
     class graph2D:
-        def __init__(self, originX = 0, originY = HEIGHT-1, width = WIDTH, height = HEIGHT, minValue=0, maxValue=255, c = 1, bars = False):
-            self.minValue = minValue
-            self.maxValue = maxValue
+        # Samples live in a fixed ring buffer, oldest to newest from head. The plot
+        # scrolls left one column per sample; autoScale fits the range to the samples
+        def __init__(self, originX = 0, originY = HEIGHT-1, width = WIDTH, height = HEIGHT, minValue=0, maxValue=255, c = 1, bars = False, autoScale = False):
             self.originX = originX
             self.originY = originY
             self.width = width
             self.height = height
             self.c = c
-            self.m = (1-height)/(maxValue-minValue)
-            self.offset = originY-self.m*minValue
             self.bars = bars
-            self.data = []
+            self.autoScale = autoScale
+            self.data = array('f', [0]*width)
+            self.head = 0
+            self.count = 0
+            self.setRange(minValue, maxValue)
+
+        def setRange(self, minValue, maxValue):
+            self.minValue = minValue
+            self.maxValue = maxValue
+            if maxValue == minValue:
+                maxValue = minValue + 1
+            self.m = (1-self.height)/(maxValue-minValue)
+            self.offset = self.originY-self.m*minValue
+
+        def values(self):
+            # Stored samples, oldest first
+            return [self.data[(self.head-self.count+i) % self.width] for i in range(self.count)]
 
     def updateGraph2D(self, graph, value):
-        graph.data.insert(0,value)
-        if len(graph.data) > graph.width:
-            graph.data.pop()
+        graph.data[graph.head] = value
+        graph.head = (graph.head+1) % graph.width
+        if graph.count < graph.width:
+            graph.count += 1
+        if graph.autoScale:
+            samples = graph.data if graph.count == graph.width else graph.data[:graph.count]
+            lo, hi = min(samples), max(samples)
+            if lo != graph.minValue or hi != graph.maxValue:
+                graph.setRange(lo, hi)
+                self.drawGraph2D(graph)
+                return
         x = graph.originX+graph.width-1
-        m = graph.c
-        for value in graph.data:
-            y = round(graph.m*value + graph.offset)
-            if graph.bars == True:
-                for idx in range(y, graph.originY+1):
-                    if x >= graph.originX and x < graph.originX+graph.width and idx <= graph.originY and idx > graph.originY-graph.height:
-                        self.pixel(x,idx, m)
+        self._shiftGraph2D(graph)
+        self.vline(x, graph.originY-graph.height+1, graph.height, 0 if graph.c else 1)
+        self._plotGraph2D(graph, x, graph.data[(graph.head-1) % graph.width])
+
+    def drawGraph2D(self, graph):
+        # Full redraw, eg. after a range change
+        self.fill_rect(graph.originX, graph.originY-graph.height+1, graph.width, graph.height, 0 if graph.c else 1)
+        x = graph.originX+graph.width-graph.count
+        for value in graph.values():
+            self._plotGraph2D(graph, x, value)
+            x += 1
+
+    def _plotGraph2D(self, graph, x, value):
+        y = round(graph.m*value + graph.offset)
+        top = graph.originY-graph.height+1
+        if graph.bars:
+            y = max(y, top)
+            if y <= graph.originY:
+                self.vline(x, y, graph.originY-y+1, graph.c)
+        elif top <= y <= graph.originY:
+            self.pixel(x, y, graph.c)
+
+    def _shiftGraph2D(self, graph):
+        # Move the plot area one column left, whole page bytes at a time
+        buf = self.buffer
+        x0 = max(graph.originX, 0)
+        x1 = min(graph.originX+graph.width, WIDTH)
+        y0 = max(graph.originY-graph.height+1, 0)
+        y1 = min(graph.originY, HEIGHT-1)
+        if x1-x0 < 2 or y0 > y1:
+            return
+        for page in range(y0 >> 3, (y1 >> 3)+1):
+            o = page*WIDTH
+            mask = (0xFF << max(y0-page*8, 0)) & (0xFF >> max(page*8+7-y1, 0))
+            if mask == 0xFF:
+                buf[o+x0:o+x1-1] = buf[o+x0+1:o+x1]
             else:
-                if x >= graph.originX and x < graph.originX+graph.width and y <= graph.originY and y > graph.originY-graph.height:
-                    self.pixel(x,y, m)
-            x -= 1
+                keep = mask ^ 0xFF
+                for i in range(o+x0, o+x1-1):
+                    buf[i] = (buf[i] & keep) | (buf[i+1] & mask)
+        self._mark(x0, y0, x1-1, y1)
 
 class PiicoDev_SSD1306_MicroPython(PiicoDev_SSD1306):
-    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C):
+    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C, double_buffer=False, on_frame=None):
         self.i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b'\x40', None]  # Co=0, D/C#=1
+        self.on_frame = on_frame
         self.init_display()
         super().__init__(self.buffer, WIDTH, HEIGHT, framebuf.MONO_VLSB)
+        if double_buffer:
+            self._start_flusher()
         self.fill(0)
         self.show()
         
 class PiicoDev_SSD1306_MicroBit(PiicoDev_SSD1306):
-    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C):
+    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C, double_buffer=False, on_frame=None):
         self.i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b'\x40', None]  # Co=0, D/C#=1
+        self.on_frame = on_frame
         self.init_display()
+        if double_buffer:
+            self._start_flusher()
         self.fill(0)
         self.show()
 
 class PiicoDev_SSD1306_Linux(PiicoDev_SSD1306):
-    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C):
+    def __init__(self, bus=None, freq=None, sda=None, scl=None, addr=0x3C, double_buffer=False, on_frame=None):
         self.i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b'\x40', None]  # Co=0, D/C#=1
+        self.on_frame = on_frame
         self.init_display()
+        if double_buffer:
+            self._start_flusher()
         self.fill(0)
         self.show()
                         
-def create_PiicoDev_SSD1306(address=0x3C,bus=None, freq=None, sda=None, scl=None, asw=None):
+def create_PiicoDev_SSD1306(address=0x3C,bus=None, freq=None, sda=None, scl=None, asw=None, double_buffer=False, on_frame=None):
     if asw == 0: _a = 0x3C
     elif asw == 1: _a = 0x3D
     else: _a = address # parse desired address from direct address input or asw switch position (0 or 1)
@@ -347,9 +724,9 @@ def create_PiicoDev_SSD1306(address=0x3C,bus=None, freq=None, sda=None, scl=None
     except:
         print(compat_str)
     if _SYSNAME == 'microbit':
-        display = PiicoDev_SSD1306_MicroBit(addr=_a, freq=freq)
+        display = PiicoDev_SSD1306_MicroBit(addr=_a, freq=freq, double_buffer=double_buffer, on_frame=on_frame)
     elif _SYSNAME == 'Linux':
-        display = PiicoDev_SSD1306_Linux(addr=_a, freq=freq)
+        display = PiicoDev_SSD1306_Linux(addr=_a, freq=freq, double_buffer=double_buffer, on_frame=on_frame)
     else:
-        display = PiicoDev_SSD1306_MicroPython(addr=_a, bus=bus, freq=freq, sda=sda, scl=scl)
+        display = PiicoDev_SSD1306_MicroPython(addr=_a, bus=bus, freq=freq, sda=sda, scl=scl, double_buffer=double_buffer, on_frame=on_frame)
     return display
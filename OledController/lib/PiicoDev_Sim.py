@@ -0,0 +1,261 @@
+'''
+PiicoDev_Sim.py: Simulated I2C bus for running PiicoDev drivers without hardware
+Select it by setting PIICODEV_SIM=1 in the environment (PIICODEV_SIM=realtime also
+sleeps for the modelled bus time), or with create_unified_i2c(sim=True).
+
+Each device on the bus is a register-map model.  The stock models hold plausible
+readings that can be changed through their attributes, eg.
+
+    i2c = create_unified_i2c(sim=True)
+    i2c.devices[0x77].raw_t = 530000
+    i2c.attach(0x40, SimDevice({0x00: b'\\x12'}))
+
+The bus counts transactions, bytes and modelled bus time so driver throughput can
+be compared on a plain Linux box.
+'''
+from struct import pack, pack_into
+from time import sleep
+from PiicoDev_Unified import I2CBase
+
+class SimLatency:
+    # Bus cost model. Defaults to start + stop + ioctl overhead of ~20 bit-times
+    # per transaction and 9 bit-times (8 data + ACK) per byte, including address bytes
+    def __init__(self, freq=100000, per_transaction_us=None, per_byte_us=None, realtime=False):
+        bit_us = 1000000 / freq
+        self.per_transaction_us = 20 * bit_us if per_transaction_us is None else per_transaction_us
+        self.per_byte_us = 9 * bit_us if per_byte_us is None else per_byte_us
+        self.realtime = realtime
+
+    def cost(self, nmsgs, nbytes):
+        us = self.per_transaction_us + (nmsgs + nbytes) * self.per_byte_us
+        if self.realtime:
+            sleep(us / 1000000)
+        return us
+
+class SimDevice:
+    # Flat, auto-incrementing register map. Subclasses refresh live registers in on_read
+    # and react to configuration writes in on_write
+    regsize = 256
+    regmask = 0xFFFF
+
+    def __init__(self, regs=None):
+        self.regs = bytearray(self.regsize)
+        if regs is not None:
+            for reg, val in regs.items():
+                self.regs[reg:reg + len(val)] = val
+
+    def read(self, reg, nbytes):
+        reg &= self.regmask
+        self.on_read(reg, nbytes)
+        return bytes(self.regs[reg:reg + nbytes]).ljust(nbytes, b'\x00')
+
+    def write(self, reg, data):
+        reg &= self.regmask
+        data = bytes(data)[:max(0, self.regsize - reg)]
+        self.regs[reg:reg + len(data)] = data
+        self.on_write(reg, data)
+
+    def write_raw(self, data):
+        # Write with no register address (eg. a bare command byte)
+        if len(data) > 0:
+            self.write(data[0], bytes(data)[1:])
+
+    def on_read(self, reg, nbytes):
+        pass
+
+    def on_write(self, reg, data):
+        pass
+
+class SimBME280(SimDevice):
+    # Calibration and raw T/P are the datasheet example (25.08 degC, 100653 Pa); ~49 %RH
+    def __init__(self):
+        super().__init__({0xD0: b'\x60'})
+        pack_into('<HhhHhhhhhhhhB', self.regs, 0x88, 27504, 26435, -1000, 36477, -10685, 3024,
+                  2855, 140, -7, 15500, -14600, 6000, 0)
+        self.regs[0xA1] = 75
+        pack_into('<hB', self.regs, 0xE1, 362, 0)
+        h4, h5 = 313, 50
+        self.regs[0xE4:0xE8] = bytes([h4 >> 4, (h4 & 0x0F) | ((h5 & 0x0F) << 4), h5 >> 4, 30])
+        self.raw_t = 519888
+        self.raw_p = 415148
+        self.raw_h = 29000
+
+    def on_read(self, reg, nbytes):
+        if reg + nbytes > 0xF7:
+            pack_into('>I', self.regs, 0xF7, self.raw_p << 12)
+            pack_into('>I', self.regs, 0xFA, self.raw_t << 12)
+            pack_into('>H', self.regs, 0xFD, self.raw_h)
+
+class SimSSD1306(SimDevice):
+    # Decodes the command stream and keeps a copy of display RAM in self.gram
+    _ARGS = {0x20: 1, 0x21: 2, 0x22: 2, 0x26: 6, 0x27: 6, 0x29: 5, 0x2A: 5, 0x81: 1, 0x8D: 1, 0xA3: 2,
+             0xA8: 1, 0xAD: 1, 0xD3: 1, 0xD5: 1, 0xD9: 1, 0xDA: 1, 0xDB: 1}
+
+    def __init__(self, width=128, height=64):
+        super().__init__()
+        self.width = width
+        self.pages = height // 8
+        self.gram = bytearray(width * self.pages)
+        self.commands = 0
+        self.data_bytes = 0
+        self._cmd = []
+        self.col0, self.col1, self.page0, self.page1 = 0, width - 1, 0, self.pages - 1
+        self.col, self.page = 0, 0
+
+    def write(self, reg, data):
+        if reg & 0x40:
+            self._data(data)
+        else:
+            for b in data:
+                self._command(b)
+
+    def _command(self, b):
+        self._cmd.append(b)
+        if len(self._cmd) <= self._ARGS.get(self._cmd[0], 0):
+            return
+        cmd = self._cmd
+        self._cmd = []
+        self.commands += 1
+        op = cmd[0]
+        if op == 0x21:
+            self.col0, self.col1 = cmd[1], cmd[2]
+            self.col = self.col0
+        elif op == 0x22:
+            self.page0, self.page1 = cmd[1], cmd[2]
+            self.page = self.page0
+        elif 0xB0 <= op <= 0xB7:
+            self.page = op & 0x07
+        elif op <= 0x0F:
+            self.col = (self.col & 0xF0) | op
+        elif op <= 0x1F:
+            self.col = (self.col & 0x0F) | ((op & 0x0F) << 4)
+
+    def _data(self, data):
+        self.data_bytes += len(data)
+        for b in data:
+            self.gram[self.page * self.width + self.col] = b
+            if self.col >= self.col1:
+                self.col = self.col0
+                self.page = self.page0 if self.page >= self.page1 else self.page + 1
+            else:
+                self.col += 1
+
+class SimLIS3DH(SimDevice):
+    regmask = 0x7F  # bit 7 of the sub-address is the auto-increment flag
+
+    def __init__(self):
+        super().__init__({0x0F: b'\x33', 0x27: b'\x0F'})
+        self.xyz = (0, 0, 16380)  # ~1 g on Z at +-2 g, high resolution
+
+    def on_read(self, reg, nbytes):
+        pack_into('<hhh', self.regs, 0x28, *self.xyz)
+
+class SimMPU6050(SimDevice):
+    def __init__(self):
+        super().__init__({0x75: b'\x68', 0x6B: b'\x40'})
+        self.accel = (0, 0, 16384)  # 1 g on Z at +-2 g
+        self.raw_temp = -3910  # ~25 degC
+        self.gyro = (0, 0, 0)
+
+    def on_read(self, reg, nbytes):
+        pack_into('>hhhhhhh', self.regs, 0x3B, *(self.accel + (self.raw_temp,) + self.gyro))
+
+class SimQMC6310(SimDevice):
+    def __init__(self):
+        super().__init__({0x00: b'\x80', 0x09: b'\x01'})
+        self.xyz = (1000, -500, 2000)
+
+    def on_read(self, reg, nbytes):
+        pack_into('<hhh', self.regs, 0x01, *self.xyz)
+
+class SimVL53L1X(SimDevice):
+    regsize = 0x10000
+
+    def __init__(self):
+        super().__init__({0x010F: b'\xEA\xCC', 0x0022: b'\x00\x14'})
+        self.distance = 500
+
+    def on_read(self, reg, nbytes):
+        self.regs[0x0089] = 9  # range valid
+        pack_into('>H', self.regs, 0x0096, self.distance)
+
+class SimTMP117(SimDevice):
+    def __init__(self):
+        super().__init__({0x0F: pack('>H', 0x0117)})
+        self.temperature = 25.0
+
+    def on_read(self, reg, nbytes):
+        pack_into('>h', self.regs, 0x00, round(self.temperature / 7.8125e-3))
+
+def default_devices():
+    return {0x77: SimBME280(), 0x3C: SimSSD1306(), 0x19: SimLIS3DH(), 0x68: SimMPU6050(),
+            0x1C: SimQMC6310(), 0x29: SimVL53L1X(), 0x48: SimTMP117()}
+
+class I2CUnifiedSim(I2CBase):
+    def __init__(self, bus=None, freq=None, devices=None, latency=None, realtime=False):
+        self.bus = bus
+        self.devices = default_devices() if devices is None else dict(devices)
+        self.latency = SimLatency(freq or 100000, realtime=realtime) if latency is None else latency
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.bus_time_us = 0
+
+    def attach(self, addr, device):
+        self.devices[addr] = device
+        return device
+
+    def detach(self, addr):
+        self.devices.pop(addr, None)
+
+    def _device(self, addr):
+        try:
+            return self.devices[addr]
+        except KeyError:
+            raise OSError(5, 'No simulated device at address 0x{:02X}'.format(addr))
+
+    def _account(self, nmsgs, nbytes):
+        self.transactions += 1
+        self.bytes += nbytes
+        self.bus_time_us += self.latency.cost(nmsgs, nbytes)
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self._device(addr).write(memaddr, buf)
+        self._account(1, addrsize // 8 + len(buf))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        data = self._device(addr).read(memaddr, nbytes)
+        self._account(2, addrsize // 8 + nbytes)
+        return data
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf), addrsize=addrsize)
+
+    def write8(self, addr, reg, data):
+        if reg is None:
+            self._device(addr).write_raw(data)
+            self._account(1, len(data))
+        else:
+            self._device(addr).write(reg[0], data)
+            self._account(1, len(reg) + len(data))
+
+    def read16(self, addr, reg):
+        data = self._device(addr).read(reg[0], 2)
+        self._account(2, len(reg) + 2)
+        return data
+
+    def run_batch(self, ops):
+        # One combined transaction, as I2CUnifiedLinux does with i2c_rdwr
+        nmsgs = 0
+        nbytes = 0
+        for addr, memaddr, buf, addrsize, is_read in ops:
+            if is_read:
+                buf[:] = self._device(addr).read(memaddr, len(buf))
+                nmsgs += 2
+            else:
+                self._device(addr).write(memaddr, buf)
+                nmsgs += 1
+            nbytes += addrsize // 8 + len(buf)
+        self._account(nmsgs, nbytes)
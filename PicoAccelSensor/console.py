@@ -11,15 +11,26 @@ class Console:
     :ivar curr_line: An integer index of the last line printed to console.
     :ivar data: An array of strings representing the lines currently
                 shown to the user.
+    :ivar shown: An array of the strings last drawn in each line slot,
+                 None where the slot's contents are unknown.
+    :ivar shown_pos: The line positions the shown lines were drawn at.
     """
-    def __init__(self):
+    def __init__(self, line_height: int = 12):
         """
         Initialises the console representation of the OLED display.
+
+        :param line_height: the pixel pitch between lines. A multiple of 8
+                            keeps lines page-aligned, so scrolling moves
+                            whole buffer pages instead of redrawing text.
         """
         self.oled = create_PiicoDev_SSD1306()
-        self.line_pos = [0, 12, 24, 36, 48]
+        self.line_height = line_height
+        self.line_pos = list(range(0, self.oled.height - 7, line_height))
         self.curr_line = 0
         self.data = []
+        self.shown = [None] * len(self.line_pos)
+        self.shown_pos = list(self.line_pos)
+        self.scrolled = 0
 
     def print(self, text: str):
         """
@@ -41,14 +52,30 @@ class Console:
         else:
             self.data.pop(0)
             self.data.insert(self.curr_line, line)
+            self.scrolled += 1
 
-    def refresh(self):
+    def refresh(self, full: bool = False):
         """
-        Refreshes the console. i.e. reprints currents lines to display.
+        Refreshes the console. i.e. reprints lines that changed since the
+        last refresh and sends only those pages to the display.
+
+        :param full: redraw every line, e.g. after drawing on the oled directly
         """
-        self.oled.fill(0)
-        for i in range(len(self.data)):
-            self.oled.text(self.data[i], 0, self.line_pos[i])
+        slots = len(self.line_pos)
+        if full or self.line_pos != self.shown_pos:
+            self.oled.fill(0)
+            self.shown = [None] * slots
+            self.shown_pos = list(self.line_pos)
+        elif 0 < self.scrolled < slots and self.line_height % 8 == 0:
+            self.oled.scroll(0, -self.scrolled * self.line_height)
+            self.shown = self.shown[self.scrolled:] + [None] * self.scrolled
+        self.scrolled = 0
+        for i in range(slots):
+            line = self.data[i] if i < len(self.data) else ''
+            if line != self.shown[i]:
+                self.oled.fill_rect(0, self.line_pos[i], self.oled.width, 8, 0)
+                self.oled.text(line, 0, self.line_pos[i])
+                self.shown[i] = line
         self.oled.show()
 
     def clear(self):
@@ -58,3 +85,5 @@ class Console:
         self.oled.fill(0)
         self.data.clear()
         self.curr_line = 0
+        self.shown = [''] * len(self.line_pos)
+        self.scrolled = 0
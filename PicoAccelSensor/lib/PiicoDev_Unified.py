@@ -4,6 +4,12 @@ Changelog:
     - 2022-10-13 P.Johnston Add helptext to run i2csetup script on Raspberry Pi 
     - 2022-10-14 M.Ruppe Explicitly set default I2C initialisation parameters for machine-class (Raspberry Pi Pico + W)
     - 2023-01-31 L.Howell Add minimal support for ESP32
+    - 2026-10-18 Add readfrom_mem_into and zero-copy buffer paths for Linux
+    - 2026-10-18 Add batched register transactions (I2CBatch, i2c.batch())
+    - 2026-10-18 Add simulated bus backend (PiicoDev_Sim), selected with PIICODEV_SIM or sim=True
+    - 2026-10-18 Share one reference-counted, lock-protected bus per bus/freq/pins (I2CShared)
+    - 2026-10-18 Add opt-in per-register transaction counters and latency histograms (I2CStats)
+    - 2026-10-18 micro:bit writeto_mem accepts any buffer (eg. memoryview)
 '''
 import os
 _SYSNAME = os.uname().sysname
@@ -13,19 +19,98 @@ setupi2c_str = ', run "sudo curl -L https://piico.dev/i2csetup | bash". Suppress
 
 if _SYSNAME == 'microbit':
     from microbit import i2c
-    from utime import sleep_ms
+    from utime import sleep_ms, ticks_us, ticks_diff
+    Lock = None
     
 elif _SYSNAME == 'Linux':
     from smbus2 import SMBus, i2c_msg
-    from time import sleep
+    from smbus2.smbus2 import I2C_M_RD
+    from ctypes import POINTER, addressof, c_char, cast, create_string_buffer, memmove, string_at
+    from threading import Lock
+    from time import sleep, perf_counter
     from math import ceil
     
     def sleep_ms(t):
         sleep(t/1000)
 
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(t1, t0):
+        return t1 - t0
+
 else:
     from machine import I2C, Pin
-    from utime import sleep_ms
+    from utime import sleep_ms, ticks_us, ticks_diff
+    try:
+        from _thread import allocate_lock as Lock
+    except ImportError:
+        Lock = None
+
+class _NoLock:
+    # Stand-in for ports without threads
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+class I2CBatch:
+    '''
+    Queue of register reads and writes issued as one bus transaction where the
+    backend allows it (a single SMBus.i2c_rdwr call on Linux).
+
+        with i2c.batch() as b:
+            status = b.read(addr, 0x09, 1)
+            xyz = b.read(addr, 0x01, 6)
+        # status and xyz are filled once the block exits
+
+    Each call to i2c.batch() returns a new batch with its own read buffers.  A
+    driver can keep one and enter it again to reuse them, so copy anything that
+    must outlive its next use.  A batch belongs to one caller at a time; on a
+    shared bus the lock is only held while the queued transaction runs, so the
+    bus can still be used directly inside the block.
+    '''
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.ops = []
+        self._pool = []
+
+    def read(self, addr, memaddr, nbytes, *, addrsize=8):
+        n = len(self.ops)
+        if n < len(self._pool) and len(self._pool[n]) == nbytes:
+            buf = self._pool[n]
+        else:
+            buf = bytearray(nbytes)
+            if n < len(self._pool):
+                self._pool[n] = buf
+            else:
+                self._pool.append(buf)
+        self.ops.append((addr, memaddr, buf, addrsize, True))
+        return buf
+
+    def write(self, addr, memaddr, buf, *, addrsize=8):
+        if len(self.ops) >= len(self._pool):
+            self._pool.append(b'')
+        self.ops.append((addr, memaddr, buf, addrsize, False))
+
+    def __enter__(self):
+        self.ops.clear()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and self.ops:
+                self.i2c.run_batch(self.ops)
+        finally:
+            self.ops.clear()
+        return False
 
 class I2CBase:
     def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
@@ -34,6 +119,9 @@ class I2CBase:
     def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
         raise NotImplementedError('readfrom_mem')
 
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        raise NotImplementedError('readfrom_mem_into')
+
     def write8(self, addr, buf, stop=True):
         raise NotImplementedError('write')
 
@@ -43,6 +131,19 @@ class I2CBase:
     def __init__(self, bus=None, freq=None, sda=None, scl=None):
         raise NotImplementedError('__init__')
 
+    def batch(self):
+        return I2CBatch(self)
+
+    def close(self):
+        pass
+
+    def run_batch(self, ops):
+        for addr, memaddr, buf, addrsize, is_read in ops:
+            if is_read:
+                self.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+            else:
+                self.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+
 class I2CUnifiedMachine(I2CBase):
     def __init__(self, bus=None, freq=None, sda=None, scl=None):
         if bus is not None and freq is not None and sda is not None and scl is not None:
@@ -55,6 +156,7 @@ class I2CUnifiedMachine(I2CBase):
 
         self.writeto_mem = self.i2c.writeto_mem
         self.readfrom_mem = self.i2c.readfrom_mem
+        self.readfrom_mem_into = self.i2c.readfrom_mem_into
 
     def write8(self, addr, reg, data):
         if reg is None:
@@ -74,12 +176,15 @@ class I2CUnifiedMicroBit(I2CBase):
             
     def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
         ad = memaddr.to_bytes(addrsize // 8, 'big')  # pad address for eg. 16 bit
-        i2c.write(addr, ad + buf)
+        i2c.write(addr, ad + bytes(buf))
         
     def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
         ad = memaddr.to_bytes(addrsize // 8, 'big')  # pad address for eg. 16 bit
         i2c.write(addr, ad, repeat=True)
         return i2c.read(addr, nbytes)    
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        buf[:] = self.readfrom_mem(addr, memaddr, len(buf), addrsize=addrsize)
     
     def write8(self, addr, reg, data):
         if reg is None:
@@ -109,43 +214,106 @@ class I2CUnifiedLinux(I2CBase):
         if bus is None:
             bus = 1
         self.i2c = SMBus(bus)
+        # Preallocated transfer buffers and messages, reused by every transaction
+        self._wbuf = create_string_buffer(34)
+        self._rbuf = create_string_buffer(32)
+        self._msg_a = i2c_msg.write(0, b'\x00')
+        self._msg_r = i2c_msg.read(0, 1)
 
-    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
-        data = [None] * nbytes # initialise empty list
-        self.smbus_i2c_read(addr, memaddr, data, nbytes, addrsize=addrsize)
-        return data
-    
-    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
-        self.smbus_i2c_write(addr, memaddr, buf, len(buf), addrsize=addrsize)
-    
-    def smbus_i2c_write(self, address, reg, data_p, length, addrsize=8):
-        ret_val = 0
-        data = []
-        for index in range(length):
-            data.append(data_p[index])
+    def _ptr(self, buf, length):
+        # Pointer to the caller's memory, copied only if it is read-only and not bytes
+        if isinstance(buf, bytes):
+            return buf
+        if isinstance(buf, (bytearray, memoryview)):
+            try:
+                return (c_char * length).from_buffer(buf)
+            except TypeError:
+                pass
+        return bytes(buf)
+
+    def _load_reg(self, reg, addrsize):
+        # Load the register address into the head of the write buffer
+        w = self._wbuf
         if addrsize == 8:
-            msg_w = i2c_msg.write(address, [reg] + data)
+            w[0] = reg
+            return 1
         elif addrsize == 16:
-            msg_w = i2c_msg.write(address, [reg >> 8, reg & 0xff] + data)
-        else:
-            raise Exception('address must be 8 or 16 bits long only')
+            w[0] = reg >> 8
+            w[1] = reg & 0xff
+            return 2
+        raise Exception('address must be 8 or 16 bits long only')
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        if len(self._rbuf) < nbytes:
+            self._rbuf = create_string_buffer(nbytes)
+        self._transfer_read(addr, memaddr, self._rbuf, nbytes, addrsize)
+        return string_at(self._rbuf, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        nbytes = len(buf)
+        self._transfer_read(addr, memaddr, (c_char * nbytes).from_buffer(buf), nbytes, addrsize)
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        nbytes = len(buf)
+        head = self._load_reg(memaddr, addrsize)
+        if len(self._wbuf) < head + nbytes:
+            w = create_string_buffer(head + nbytes)
+            memmove(w, self._wbuf, head)
+            self._wbuf = w
+        memmove(addressof(self._wbuf) + head, self._ptr(buf, nbytes), nbytes)
+        msg_w = self._msg_a
+        msg_w.addr = addr
+        msg_w.len = head + nbytes
+        msg_w.buf = self._wbuf
         self.i2c.i2c_rdwr(msg_w)
-        return ret_val
-        
-    def smbus_i2c_read(self, address, reg, data_p, length, addrsize=8):
-        ret_val = 0
-        if addrsize == 8:
-            msg_w = i2c_msg.write(address, [reg]) # warning this is set up for 16-bit addresses
-        elif addrsize == 16:
-            msg_w = i2c_msg.write(address, [reg >> 8, reg & 0xff]) # warning this is set up for 16-bit addresses
+
+    def _transfer_read(self, address, reg, dest, length, addrsize):
+        msg_w = self._msg_a
+        msg_w.addr = address
+        msg_w.len = self._load_reg(reg, addrsize)
+        msg_w.buf = self._wbuf
+        if dest is self._rbuf:
+            msg_r = self._msg_r
+            msg_r.addr = address
+            msg_r.len = length
+            msg_r.buf = cast(dest, POINTER(c_char))
         else:
-            raise Exception('address must be 8 or 16 bits long only')
-        msg_r = i2c_msg.read(address, length)
+            # A caller's buffer gets its own message, and no cast() (whose result
+            # is freed only by the garbage collector), so no reference to it
+            # outlives the transfer and a bytearray can still be resized
+            msg_r = i2c_msg(addr=address, flags=I2C_M_RD, len=length, buf=dest)
         self.i2c.i2c_rdwr(msg_w, msg_r)
-        if ret_val == 0:
-            for index in range(length):
-                data_p[index] = ord(msg_r.buf[index])
-        return ret_val
+
+    def run_batch(self, ops):
+        msgs = []
+        for addr, memaddr, buf, addrsize, is_read in ops:
+            head = addrsize // 8
+            if head not in (1, 2):
+                raise Exception('address must be 8 or 16 bits long only')
+            reg = memaddr.to_bytes(head, 'big')
+            # The kernel accepts at most 42 messages per I2C_RDWR ioctl
+            if len(msgs) + 1 + is_read > 42:
+                self.i2c.i2c_rdwr(*msgs)
+                msgs = []
+            if is_read:
+                nbytes = len(buf)
+                msgs.append(i2c_msg.write(addr, reg))
+                msgs.append(i2c_msg(addr=addr, flags=I2C_M_RD, len=nbytes,
+                                    buf=(c_char * nbytes).from_buffer(buf)))
+            else:
+                msgs.append(i2c_msg.write(addr, reg + bytes(buf)))
+        self.i2c.i2c_rdwr(*msgs)
+
+    def close(self):
+        self.i2c.close()
+
+    def smbus_i2c_write(self, address, reg, data_p, length, addrsize=8):
+        self.writeto_mem(address, reg, data_p[:length], addrsize=addrsize)
+        return 0
+
+    def smbus_i2c_read(self, address, reg, data_p, length, addrsize=8):
+        data_p[:length] = self.readfrom_mem(address, reg, length, addrsize=addrsize)
+        return 0
     
     def write8(self, addr, reg, data):
         if reg is None:
@@ -160,11 +328,184 @@ class I2CUnifiedLinux(I2CBase):
         regInt = int.from_bytes(reg, 'big')
         return self.i2c.read_word_data(addr, regInt).to_bytes(2, byteorder='little', signed=False)
 
-def create_unified_i2c(bus=None, freq=None, sda=None, scl=None, suppress_warnings=True):
-    if _SYSNAME == 'microbit':
-        i2c = I2CUnifiedMicroBit(freq=freq)
+class I2CStats(I2CBase):
+    '''
+    Wraps a bus and counts transactions, bytes and latency per (address, register).
+    Enable it on a shared bus with i2c.enable_stats(); while disabled the bus is not
+    wrapped at all.  Latencies are binned into the upper bounds of BUCKETS_US, with a
+    final bucket for anything slower.
+    '''
+    BUCKETS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.reset_stats()
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+    def reset_stats(self):
+        self.stats = {}
+
+    def _record(self, addr, reg, nbytes, us):
+        try:
+            entry = self.stats[(addr, reg)]
+        except KeyError:
+            entry = self.stats[(addr, reg)] = [0, 0, 0, 0, [0] * (len(self.BUCKETS_US) + 1)]
+        entry[0] += 1
+        entry[1] += nbytes
+        entry[2] += us
+        if us > entry[3]:
+            entry[3] = us
+        i = 0
+        for bound in self.BUCKETS_US:
+            if us < bound:
+                break
+            i += 1
+        entry[4][i] += 1
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        t0 = ticks_us()
+        r = self.bus.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+        self._record(addr, memaddr, len(buf), ticks_diff(ticks_us(), t0))
+        return r
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        t0 = ticks_us()
+        r = self.bus.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+        self._record(addr, memaddr, nbytes, ticks_diff(ticks_us(), t0))
+        return r
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        t0 = ticks_us()
+        r = self.bus.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        self._record(addr, memaddr, len(buf), ticks_diff(ticks_us(), t0))
+        return r
+
+    def write8(self, addr, reg, data):
+        t0 = ticks_us()
+        r = self.bus.write8(addr, reg, data)
+        self._record(addr, None if reg is None else reg[0], len(data), ticks_diff(ticks_us(), t0))
+        return r
+
+    def read16(self, addr, reg):
+        t0 = ticks_us()
+        r = self.bus.read16(addr, reg)
+        self._record(addr, reg[0], 2, ticks_diff(ticks_us(), t0))
+        return r
+
+    def run_batch(self, ops):
+        # The batch is one bus transaction; its time is split evenly across the queued ops
+        t0 = ticks_us()
+        r = self.bus.run_batch(ops)
+        us = ticks_diff(ticks_us(), t0) // len(ops)
+        for addr, memaddr, buf, addrsize, is_read in ops:
+            self._record(addr, memaddr, len(buf), us)
+        return r
+
+    def snapshot(self):
+        snap = {}
+        for key, (count, nbytes, total_us, max_us, hist) in self.stats.items():
+            snap[key] = {'count': count, 'bytes': nbytes, 'total_us': total_us,
+                         'max_us': max_us, 'hist': tuple(hist)}
+        return snap
+
+    def dump(self):
+        lines = ['addr reg   count   bytes avg_us max_us hist(<' + ',<'.join([str(b) for b in self.BUCKETS_US]) + ',more)']
+        for (addr, reg), (count, nbytes, total_us, max_us, hist) in sorted(self.stats.items(), key=lambda kv: -kv[1][2]):
+            lines.append('0x{:02X} {:5} {:6d} {:7d} {:6d} {:6d} {}'.format(
+                addr, '--' if reg is None else '0x{:02X}'.format(reg), count, nbytes, total_us // count,
+                max_us, '/'.join([str(n) for n in hist])))
+        return '\n'.join(lines)
+
+class I2CShared(I2CBase):
+    '''
+    A bus shared by every driver created with the same bus/freq/pins.  Calls are
+    serialised with a lock, and the underlying bus is released when the last user
+    calls close().  Attributes not defined here are looked up on the wrapped bus.
+    '''
+    def __init__(self, key, bus):
+        self.key = key
+        self.bus = bus
+        self.lock = Lock() if Lock is not None else _NoLock()
+        self.refs = 0
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        with self.lock:
+            return self.bus.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        with self.lock:
+            return self.bus.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        with self.lock:
+            return self.bus.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+
+    def write8(self, addr, reg, data):
+        with self.lock:
+            return self.bus.write8(addr, reg, data)
+
+    def read16(self, addr, reg):
+        with self.lock:
+            return self.bus.read16(addr, reg)
+
+    def run_batch(self, ops):
+        with self.lock:
+            return self.bus.run_batch(ops)
+
+    def enable_stats(self):
+        with self.lock:
+            if not isinstance(self.bus, I2CStats):
+                self.bus = I2CStats(self.bus)
+        return self.bus
+
+    def disable_stats(self):
+        with self.lock:
+            if isinstance(self.bus, I2CStats):
+                self.bus = self.bus.bus
+
+    def close(self):
+        with _registry_lock:
+            if self.refs <= 0:
+                return
+            self.refs -= 1
+            if self.refs > 0:
+                return
+            if _registry.get(self.key) is self:
+                del _registry[self.key]
+        with self.lock:
+            self.bus.close()
+
+_registry = {}
+_registry_lock = Lock() if Lock is not None else _NoLock()
+
+def _open_unified_i2c(bus, freq, sda, scl, suppress_warnings, sim):
+    if sim:
+        from PiicoDev_Sim import I2CUnifiedSim
+        return I2CUnifiedSim(bus=bus, freq=freq, realtime=(sim == 'realtime'))
+    elif _SYSNAME == 'microbit':
+        return I2CUnifiedMicroBit(freq=freq)
     elif _SYSNAME == 'Linux':
-        i2c = I2CUnifiedLinux(bus=bus, suppress_warnings=suppress_warnings)
+        return I2CUnifiedLinux(bus=bus, suppress_warnings=suppress_warnings)
     else:
-        i2c = I2CUnifiedMachine(bus=bus, freq=freq, sda=sda, scl=scl)
+        return I2CUnifiedMachine(bus=bus, freq=freq, sda=sda, scl=scl)
+
+def create_unified_i2c(bus=None, freq=None, sda=None, scl=None, suppress_warnings=True, sim=None, shared=True):
+    if sim is None:
+        getenv = getattr(os, 'getenv', None) # MicroPython has no environment
+        sim = getenv('PIICODEV_SIM', '') if getenv is not None else ''
+        sim = sim if sim not in ('', '0') else False
+    if not shared:
+        return _open_unified_i2c(bus, freq, sda, scl, suppress_warnings, sim)
+    key = (sim, bus, freq, str(sda), str(scl))
+    with _registry_lock:
+        i2c = _registry.get(key)
+        if i2c is None:
+            i2c = I2CShared(key, _open_unified_i2c(bus, freq, sda, scl, suppress_warnings, sim))
+            _registry[key] = i2c
+        i2c.refs += 1
     return i2c
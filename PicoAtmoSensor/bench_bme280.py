@@ -0,0 +1,257 @@
+"""
+BME280 Compensation Benchmark
+
+Cross-checks the 'float' and 'int32' compensation modes of the BME280
+driver against the 64-bit integer reference ('int'), and checks that
+'int32' gives exactly what its pressure formula gives with unbounded
+ints. Then measures samples per second and heap allocation per sample
+for each mode.
+
+Run on the Pico with the sensor attached, or on Linux against the
+simulated bus from this directory:
+
+    PIICODEV_SIM=1 python3 bench_bme280.py
+
+MicroPython reports the bytes allocated per sample (gc.mem_alloc).
+CPython allocates every int and float, so there the largest
+intermediate value of each mode is traced instead. An integer mode
+allocates nothing on MicroPython if it stays within the small-int
+range (|x| < 2**30 on the Pico).
+
+Author: Sam Rogers
+
+Created: 18/10/2026
+"""
+import sys
+import gc
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(t1, t0):
+        return t1 - t0
+if sys.implementation.name != "micropython":
+    sys.path.insert(0, "lib")
+from PiicoDev_BME280 import PiicoDev_BME280
+
+__author__ = "Sam Rogers"
+__version__ = "1.0"
+
+# Calibration fields of the sensor, as attributes of the driver
+CAL_FIELDS = ("T1", "T2", "T3", "P1", "P2", "P3", "P4", "P5", "P6", "P7",
+              "P8", "P9", "H1", "H2", "H3", "H4", "H5", "H6")
+
+# Operating range of the sensor: temperature (degC*100), pressure (Pa)
+T_RANGE = (-4000, 8500)
+P_RANGE = (30000, 110000)
+
+# Largest magnitude of a MicroPython small int on the Pico
+SMALL_INT = 1 << 30
+
+
+class Tracked(int):
+    """
+    An int that records the largest magnitude produced by arithmetic on
+    it (CPython only).
+    """
+    peak = 0
+
+    def __new__(cls, value):
+        value = int(value)
+        if abs(value) > Tracked.peak:
+            Tracked.peak = abs(value)
+        return int.__new__(cls, value)
+
+
+def _tracked_op(name):
+    op = getattr(int, name)
+
+    def method(self, *args):
+        result = op(self, *args)
+        return result if result is NotImplemented else Tracked(result)
+    return method
+
+
+if sys.implementation.name != "micropython":
+    for _name in ("__add__", "__radd__", "__sub__", "__rsub__", "__mul__",
+                  "__rmul__", "__floordiv__", "__rfloordiv__", "__mod__",
+                  "__rmod__", "__lshift__", "__rlshift__", "__rshift__",
+                  "__rrshift__", "__and__", "__rand__", "__neg__"):
+        setattr(Tracked, _name, _tracked_op(_name))
+
+
+def set_calibration(atmo: PiicoDev_BME280, cal: dict):
+    """
+    Replace the driver's calibration with the given values.
+    """
+    for name in CAL_FIELDS:
+        setattr(atmo, "_" + name, cal[name])
+    atmo._init_float()
+
+
+def calibrations(atmo: PiicoDev_BME280, count: int, seed: int = 1):
+    """
+    Yield the sensor's own calibration, then count variations of it with
+    each value scaled by 0.8-1.2 and clipped to its register range.
+    """
+    import random
+    random.seed(seed)
+    base = dict((name, getattr(atmo, "_" + name)) for name in CAL_FIELDS)
+    yield base
+    unsigned = {"T1": 65535, "P1": 65535, "H1": 255, "H3": 255,
+                "H4": 4095, "H5": 4095}
+    for i in range(count):
+        cal = {}
+        for name, value in base.items():
+            lo, hi = (0, unsigned[name]) if name in unsigned else \
+                (-128, 127) if name == "H6" else (-32768, 32767)
+            value = int(value * random.uniform(0.8, 1.2)) + \
+                random.randint(-20, 20)
+            cal[name] = max(lo, min(hi, value))
+        yield cal
+
+
+def pressure_int32(atmo: PiicoDev_BME280, t_fine: int, raw_p: int) -> int:
+    """
+    The datasheet 32-bit pressure formula (in Pa), with two more fraction
+    bits kept in the divisor as the 'int32' mode does, using unbounded
+    ints.
+    """
+    var1 = (t_fine >> 1) - 64000
+    var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * atmo._P6
+    var2 = var2 + ((var1 * atmo._P5) << 1)
+    var2 = (var2 >> 2) + (atmo._P4 << 16)
+    var1 = (((atmo._P3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3) +
+            ((atmo._P2 * var1) >> 1)) >> 16
+    var1 = ((131072 + var1) * atmo._P1) >> 15
+    if var1 == 0:
+        return 0
+    p = ((1048576 - raw_p) - (var2 >> 12)) * 25000 // var1
+    var1 = (atmo._P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+    var2 = ((p >> 2) * atmo._P8) >> 13
+    return p + ((var1 + var2 + atmo._P7) >> 4)
+
+
+def cross_check(atmo: PiicoDev_BME280, cals: int, step: int) -> dict:
+    """
+    Sweep raw readings over the operating range, for the sensor's
+    calibration and cals variations of it, and find the largest error of
+    each mode against the 64-bit integer reference.
+
+    :return: mode -> [degC, Pa, %RH] maximum absolute errors, and
+             "datasheet" -> number of 'int32' pressures that differ from
+             pressure_int32()
+    """
+    worst = {"float": [0, 0, 0], "int32": [0, 0, 0], "datasheet": 0}
+    for cal in calibrations(atmo, cals):
+        set_calibration(atmo, cal)
+        for raw_t in range(0, 1 << 20, step):
+            for raw_p in range(0, 1 << 20, step):
+                raw_h = (raw_t + raw_p) & 0xFFFF
+                ref = atmo._compensate_int(raw_t, raw_p, raw_h)
+                if not (T_RANGE[0] <= ref[0] <= T_RANGE[1] and
+                        P_RANGE[0] * 256 <= ref[1] <= P_RANGE[1] * 256):
+                    continue
+                t_fine = atmo._t_fine
+                for mode in ("float", "int32"):
+                    err = worst[mode]
+                    got = getattr(atmo, "_compensate_" + mode)(raw_t, raw_p,
+                                                               raw_h)
+                    for i, scale in enumerate((100, 256, 1024)):
+                        e = abs(got[i] - ref[i]) / scale
+                        if e > err[i]:
+                            err[i] = e
+                if got[1] != pressure_int32(atmo, t_fine, raw_p) << 8:
+                    worst["datasheet"] += 1
+    return worst
+
+
+def peak_intermediate(atmo: PiicoDev_BME280, cals: int, step: int) -> dict:
+    """
+    Trace the largest intermediate value of each integer mode over the
+    cross-check sweep (CPython only).
+
+    :return: mode -> largest magnitude
+    """
+    peaks = {"int": 0, "int32": 0}
+    for cal in calibrations(atmo, cals):
+        set_calibration(atmo, dict((k, Tracked(v)) for k, v in cal.items()))
+        for raw_t in range(0, 1 << 20, step):
+            for raw_p in range(0, 1 << 20, step):
+                raw_h = (raw_t + raw_p) & 0xFFFF
+                ref = atmo._compensate_int(raw_t, raw_p, raw_h)
+                if not (T_RANGE[0] <= ref[0] <= T_RANGE[1] and
+                        P_RANGE[0] * 256 <= ref[1] <= P_RANGE[1] * 256 and
+                        ref[2] < 100 * 1024):
+                    continue
+                for mode in peaks:
+                    Tracked.peak = 0
+                    getattr(atmo, "_compensate_" + mode)(
+                        Tracked(raw_t), Tracked(raw_p), Tracked(raw_h))
+                    peaks[mode] = max(peaks[mode], Tracked.peak)
+    return peaks
+
+
+def benchmark(atmo: PiicoDev_BME280, mode: str, n: int) -> tuple:
+    """
+    Time n compensations of a typical reading in the given mode.
+
+    :return: samples per second, and bytes allocated per sample (None
+             where the port cannot report it)
+    """
+    compensate = getattr(atmo, "_compensate_" + mode)
+    raw_t, raw_p, raw_h = 519888, 415148, 29000
+    mem_alloc = getattr(gc, "mem_alloc", None)
+    gc.collect()
+    gc.disable()
+    before = mem_alloc() if mem_alloc else 0
+    start = ticks_ms()
+    for i in range(n):
+        compensate(raw_t, raw_p, raw_h)
+    elapsed = ticks_diff(ticks_ms(), start)
+    after = mem_alloc() if mem_alloc else 0
+    gc.enable()
+    return (n * 1000 // max(elapsed, 1),
+            (after - before) / n if mem_alloc else None)
+
+
+def main():
+    """
+    Main Loop
+
+    Run the cross-check and benchmarks, printing the results.
+    """
+    micropython = sys.implementation.name == "micropython"
+    atmo = PiicoDev_BME280()
+    own = dict((name, getattr(atmo, "_" + name)) for name in CAL_FIELDS)
+    cals, step = (4, 32768) if micropython else (60, 8192)
+
+    print("Max error against 'int' (%d calibrations):" % (cals + 1))
+    worst = cross_check(atmo, cals, step)
+    for mode in ("float", "int32"):
+        print("  %-6s %.4f degC  %.3f Pa  %.4f %%RH" % (
+            mode, worst[mode][0], worst[mode][1], worst[mode][2]))
+    print("  int32 pressures differing from unbounded-int formula: %d" %
+          worst["datasheet"])
+    if not micropython:
+        print("Largest intermediate (small ints are below 2**30):")
+        for mode, peak in peak_intermediate(atmo, cals, step * 4).items():
+            print("  %-6s %d (< 2**%d) %s" % (
+                mode, peak, peak.bit_length(),
+                "small" if peak < SMALL_INT else "allocates"))
+
+    set_calibration(atmo, own)
+    print("Compensation only:")
+    for mode in ("int", "float", "int32"):
+        rate, alloc = benchmark(atmo, mode, 2000 if micropython else 100000)
+        print("  %-6s %7d samples/s  %s" % (
+            mode, rate, "%.1f bytes/sample" % alloc
+            if alloc is not None else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""
+SSD1306 Display Benchmark
+
+Counts the I2C transactions and bytes that Console.refresh() costs on
+the PiicoDev OLED Module, for the PicoAtmoSensor readings screen, and
+times each drawing primitive. First checks that load_pbm() draws a
+truncated PBM image as the per-pixel loader did, and off MicroPython
+that the driver calls no bytes or str method MicroPython lacks.
+
+Run on the Pico with the display attached, or on Linux against the
+simulated bus from this directory:
+
+    PIICODEV_SIM=1 python3 bench_ssd1306.py
+
+To compare with another version of the driver, pass the directory that
+holds its PiicoDev_SSD1306.py, e.g. one checked out from git:
+
+    mkdir /tmp/old
+    git show <commit>:PicoAtmoSensor/lib/PiicoDev_SSD1306.py \\
+        > /tmp/old/PiicoDev_SSD1306.py
+    PIICODEV_SIM=1 python3 bench_ssd1306.py /tmp/old
+
+Author: Sam Rogers
+
+Created: 18/10/2026
+"""
+import sys
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(t1, t0):
+        return t1 - t0
+if sys.implementation.name != "micropython":
+    import os
+    _here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(_here, "lib"))
+    sys.path.insert(0, _here)
+    if len(sys.argv) > 1:
+        sys.path.insert(0, os.path.abspath(sys.argv[1]))
+    os.chdir(os.path.join(_here, "lib", "piicodev"))  # font file
+from console import Console
+from PiicoDev_SSD1306 import WIDTH, HEIGHT
+
+__author__ = "Sam Rogers"
+__version__ = "1.0"
+
+# The readings screen of PicoAtmoSensor/main.py
+SCREEN = ["---Atmo Sensor---", "TMP: 25.08C", "PRE: 1006.53hPa",
+          "HUM: 49.43%RH", "ALT: 0.0m"]
+SCREEN_POS = [0, 15, 27, 39, 51]
+
+# bytes and str methods of CPython that MicroPython does not implement
+CPYTHON_ONLY = ("ljust", "rjust", "zfill", "expandtabs", "removeprefix",
+                "removesuffix", "translate", "maketrans", "casefold",
+                "swapcase", "title")
+
+
+def bus_cost(stats, run, n: int) -> tuple:
+    """
+    Run a workload n times and average its cost on the bus.
+
+    :param stats: the bus statistics (i2c.enable_stats())
+    :param run: the workload, called with the iteration number
+    :param n: the number of iterations
+    :return: transactions, bytes, modelled bus time in ms (simulated bus
+             only, else None) and wall time in ms, each per iteration
+    """
+    stats.reset_stats()
+    bus_us = getattr(stats, "bus_time_us", None)
+    start = ticks_us()
+    for i in range(n):
+        run(i)
+    elapsed = ticks_diff(ticks_us(), start)
+    count = 0
+    nbytes = 0
+    for entry in stats.snapshot().values():
+        count += entry["count"]
+        nbytes += entry["bytes"]
+    if bus_us is not None:
+        bus_us = (stats.bus_time_us - bus_us) / n / 1000
+    return count / n, nbytes / n, bus_us, elapsed / n / 1000
+
+
+def print_cost(name: str, cost: tuple):
+    """
+    Print one line of bus costs.
+    """
+    count, nbytes, bus_ms, wall_ms = cost
+    print("  %-22s %7.1f transactions %7.1f bytes %s %7.2f ms wall" % (
+        name, count, nbytes,
+        "%7.2f ms bus" % bus_ms if bus_ms is not None else "", wall_ms))
+
+
+def bench_console(n: int):
+    """
+    Measure Console.refresh() on the readings screen.
+    """
+    console = Console()
+    stats = console.oled.i2c.enable_stats()
+    console.data = list(SCREEN)
+    console.line_pos = list(SCREEN_POS)
+    console.refresh()
+
+    def changed(i):
+        console.data[4] = "ALT: %.2fm" % (i / 100)
+        console.refresh()
+
+    def unchanged(i):
+        console.refresh()
+
+    def full(i):
+        console.refresh(full=True)
+
+    print("Console.refresh() per call:")
+    print_cost("one reading changed", bus_cost(stats, changed, n))
+    print_cost("nothing changed", bus_cost(stats, unchanged, n))
+    print_cost("full redraw", bus_cost(stats, full, n))
+    console.oled.i2c.disable_stats()
+
+
+def bench_primitives(n: int):
+    """
+    Time each drawing primitive, drawing into the buffer only.
+    """
+    oled = Console().oled
+    tests = (
+        ("fill", lambda: oled.fill(1)),
+        ("pixel", lambda: oled.pixel(64, 32, 1)),
+        ("hline 128px", lambda: oled.hline(0, 20, 128, 1)),
+        ("vline 64px", lambda: oled.vline(20, 0, 64, 1)),
+        ("fill_rect 128x64", lambda: oled.fill_rect(0, 0, 128, 64, 1)),
+        ("fill_rect 40x12 @y=3", lambda: oled.fill_rect(10, 3, 40, 12, 1)),
+        ("rect 100x40", lambda: oled.rect(10, 10, 100, 40, 1)),
+        ("text 16 chars", lambda: oled.text("ALT: 1234.56m   ", 0, 51, 1)),
+    )
+    print("Drawing primitives per call:")
+    for name, draw in tests:
+        start = ticks_us()
+        for i in range(n):
+            draw()
+        print("  %-22s %9.1f us" % (name, ticks_diff(ticks_us(), start) / n))
+
+
+def cpython_only_calls(path: str) -> list:
+    """
+    Find calls in a source file to methods in CPYTHON_ONLY (CPython only).
+
+    :param path: the source file to scan
+    :return: "name:line" for each call found
+    """
+    import ast
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    return ["%s:%d" % (node.func.attr, node.lineno)
+            for node in ast.walk(tree)
+            if isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Attribute) and
+            node.func.attr in CPYTHON_ONLY]
+
+
+def check_pbm(name: str = "check.pbm") -> bool:
+    """
+    Load a PBM image cut short part way through a row, and compare the
+    buffer with the per-pixel loader, reading missing bytes as blank.
+
+    :param name: a scratch file for the image, removed afterwards
+    :return: True if every pixel matches
+    """
+    import os
+    oled = Console().oled
+    size = WIDTH // 8 * HEIGHT
+    data = bytes((i * 37 + 11) & 0xFF for i in range(size * 2 // 3 + 5))
+    with open(name, "wb") as f:
+        f.write(b"P4\n# truncated\n128 64\n" + data)
+    try:
+        oled.fill(0)
+        oled.load_pbm(name, 1)
+    finally:
+        os.remove(name)
+    data += bytes(size - len(data))
+    expected = bytearray(WIDTH * HEIGHT)
+    for byte in range(size):
+        for bit in range(8):
+            if data[byte] & 1 << bit:
+                expected[((8 - bit) + byte * 8) % WIDTH +
+                         byte * 8 // WIDTH * WIDTH] = 1
+    bad = 0
+    for y in range(HEIGHT):
+        for x in range(WIDTH):
+            if oled.pixel(x, y) != expected[y * WIDTH + x]:
+                bad += 1
+    print("load_pbm() of a truncated image: %s" % (
+        "%d pixels differ" % bad if bad else "ok"))
+    if sys.implementation.name != "micropython":
+        calls = cpython_only_calls(sys.modules[type(oled).__module__].__file__)
+        print("CPython-only calls in the driver: %s" % (
+            ", ".join(calls) if calls else "none"))
+        bad += len(calls)
+    return not bad
+
+
+def main():
+    """
+    Main Loop
+
+    Run the checks and benchmarks, printing the results.
+    """
+    check_pbm()
+    bench_console(20)
+    bench_primitives(200)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,37 @@
 # Original repo https://bit.ly/2yJwysL
 
 from PiicoDev_Unified import *
+try:
+    from ustruct import unpack_from
+    from ucollections import namedtuple
+except:
+    from struct import unpack_from
+    from collections import namedtuple
 
 compat_str = '\nUnified PiicoDev library out of date.  Get the latest module: https://piico.dev/unified \n'
 
+AtmoReading = namedtuple("reading", ("temperature", "pressure", "humidity", "altitude"))
+
+# Named settings (t_mode, p_mode, h_mode, iir, t_sb)
+# modes are oversampling codes 0:skip 1:x1 2:x2 3:x4 4:x8 5:x16, iir 0:off 1:2 2:4 3:8 4:16
+PROFILES = {
+    'weather': (1, 1, 1, 0, 5),  # lowest noise is not needed, one sample a second
+    'indoor': (2, 5, 1, 4, 0),   # datasheet indoor navigation settings
+    'gaming': (1, 3, 0, 2, 0),   # fast altitude tracking, humidity skipped
+    'max-rate': (1, 1, 0, 0, 0), # shortest conversion, no filtering
+}
+PROFILES['fast'] = PROFILES['gaming']
+
+_T_SB_US = (500, 62500, 125000, 250000, 500000, 1000000, 10000, 20000)
+
+def _mulshr(a, b, s):
+    # (a*b)>>s for |a| < 2**20, |b| < 2**18 and s >= 10, split so that no intermediate
+    # leaves MicroPython's small-int range (|x| < 2**30)
+    return ((a>>10)*b + (((a&1023)*b)>>10))>>(s-10)
+
 class PiicoDev_BME280:
 
-    def __init__(self, bus=None, freq=None, sda=None, scl=None, t_mode=2, p_mode=5, h_mode=1, iir=1, address=0x77):
+    def __init__(self, bus=None, freq=None, sda=None, scl=None, t_mode=2, p_mode=5, h_mode=1, iir=1, address=0x77, t_sb=None, max_age_ms=0, pressure_sea_level=1013.25, compensation='int', profile=None):
         try:
             if compat_ind >= 1:
                 pass
@@ -23,39 +48,50 @@ class PiicoDev_BME280:
         self.h_mode = h_mode
         self.iir = iir
         self.addr = address
+        self.t_sb = 0
+        self.normal = False
+        self.max_age_ms = max_age_ms
+        self.pressure_sea_level = pressure_sea_level
+        self.compensation = compensation
+        self._sample = None
+        self._sample_time = 0
 
         self._t_fine = 0
+        self._data = bytearray(8)
         try:
-            self._T1 = self._read16(0x88)
+            cal = self.i2c.readfrom_mem(self.addr, 0x88, 26) # 0x88-0xA1
         except Exception as e:
             print(i2c_err_str.format(self.addr))
             raise e
-        self._T2 = self._short(self._read16(0x8A))
-        self._T3 = self._short(self._read16(0x8C))
-        self._P1 = self._read16(0x8E)
-        self._P2 = self._short(self._read16(0x90))
-        self._P3 = self._short(self._read16(0x92))
-        self._P4 = self._short(self._read16(0x94))
-        self._P5 = self._short(self._read16(0x96))
-        self._P6 = self._short(self._read16(0x98))
-        self._P7 = self._short(self._read16(0x9A))
-        self._P8 = self._short(self._read16(0x9C))
-        self._P9 = self._short(self._read16(0x9E))
-        self._H1 = self._read8(0xA1)
-        self._H2 = self._short(self._read16(0xE1))
-        self._H3 = self._read8(0xE3)
-        a = self._read8(0xE5)
-        self._H4 = (self._read8(0xE4)<<4)+(a%16)
-        self._H5 = (self._read8(0xE6)<<4)+(a>>4)
-        self._H6 = self._read8(0xE7)
-        if self._H6 > 127:
-            self._H6 -= 256
+        (self._T1, self._T2, self._T3,
+         self._P1, self._P2, self._P3, self._P4, self._P5,
+         self._P6, self._P7, self._P8, self._P9) = unpack_from('<HhhHhhhhhhhh', cal)
+        self._H1 = cal[25]
+        cal = self.i2c.readfrom_mem(self.addr, 0xE1, 7) # 0xE1-0xE7
+        self._H2, self._H3 = unpack_from('<hB', cal)
+        a = cal[4]
+        self._H4 = (cal[3]<<4)+(a%16)
+        self._H5 = (cal[5]<<4)+(a>>4)
+        self._H6 = unpack_from('<b', cal, 6)[0]
+        self._init_float()
         self._write8(0xF2, self.h_mode)
         sleep_ms(2)
         self._write8(0xF4, 0x24)
         sleep_ms(2)
         self._write8(0xF5, self.iir<<2)
+        if profile is not None:
+            self.set_profile(profile)
+        if t_sb is not None:
+            self.set_normal_mode(t_sb)
         
+    def _init_float(self):
+        # Calibration pre-scaled for the floating-point formulas (datasheet section 8.1)
+        self._fT = (self._T1/1024.0, float(self._T2), self._T1/8192.0, float(self._T3))
+        self._fP = (float(self._P1), self._P2/524288.0, self._P3/274877906944.0, self._P4*65536.0,
+                    self._P5*2.0, self._P6/32768.0, self._P7/16.0, self._P8/524288.0, self._P9/34359738368.0)
+        self._fH = (self._H1/524288.0, self._H2/65536.0, self._H3/67108864.0, self._H4*64.0,
+                    self._H5/16384.0, self._H6/67108864.0)
+
     def _read8(self, reg):
         t = self.i2c.readfrom_mem(self.addr, reg, 1)
         return t[0]
@@ -73,30 +109,90 @@ class PiicoDev_BME280:
         else:
             return dat
 
-    def read_raw_data(self):
-        self._write8(0xF4, (self.p_mode << 5 | self.t_mode << 2 | 1))
-        sleep_time = 1250
+    def _ctrl_meas(self, mode):
+        return self.t_mode << 5 | self.p_mode << 2 | mode
+
+    def measurement_time_us(self):
+        # Maximum conversion time for the current oversampling (datasheet section 9.1)
+        t = 1250
         if self.t_mode in [1, 2, 3, 4, 5]:
-            sleep_time += 2300*(1<< self.t_mode)
+            t += 2300*(1<<(self.t_mode-1))
         if self.p_mode in [1, 2, 3, 4, 5]:
-            sleep_time += 575+(2300*(1<<self.p_mode))
+            t += 575+(2300*(1<<(self.p_mode-1)))
         if self.h_mode in [1, 2, 3, 4, 5]:
-            sleep_time += 575+(2300*(1<<self.h_mode))
-        sleep_ms(1+sleep_time//1000)
-        while(self._read16(0xF3) & 0x08):
-            sleep_ms(1)
-        raw_p = ((self._read8(0xF7)<<16)|(self._read8(0xF8)<<8)|self._read8(0xF9))>>4
-        raw_t = ((self._read8(0xFA)<<16)|(self._read8(0xFB)<<8)|self._read8(0xFC))>>4
-        raw_h = (self._read8(0xFD) << 8)| self._read8(0xFE)
+            t += 575+(2300*(1<<(self.h_mode-1)))
+        return t
+
+    def set_profile(self, profile):
+        # Switch oversampling, IIR and standby together; calibration is kept
+        self.t_mode, self.p_mode, self.h_mode, self.iir, t_sb = PROFILES[profile]
+        if self.normal:
+            self.set_normal_mode(t_sb)
+        else:
+            self.t_sb = t_sb
+            self._write8(0xF2, self.h_mode)
+            self._write8(0xF5, self.t_sb<<5 | self.iir<<2)
+            self._sample = None
+
+    def max_rate(self):
+        # Achievable samples/sec: conversion + standby in normal mode, or conversion
+        # rounded up to the forced-mode sleep in read_raw_data
+        t = self.measurement_time_us()
+        if self.normal:
+            return 1000000/(t + _T_SB_US[self.t_sb])
+        return 1000/(1 + t//1000)
+
+    def set_normal_mode(self, t_sb=0):
+        # Sample continuously; t_sb selects the standby between conversions
+        # 0:0.5ms 1:62.5ms 2:125ms 3:250ms 4:500ms 5:1000ms 6:10ms 7:20ms
+        self.t_sb = t_sb & 0x07
+        self._write8(0xF4, self._ctrl_meas(0)) # config is only writable in sleep mode
+        self._write8(0xF5, self.t_sb<<5 | self.iir<<2)
+        self._write8(0xF2, self.h_mode)
+        self._write8(0xF4, self._ctrl_meas(3))
+        self.normal = True
+        self._sample = None
+        sleep_ms(1+self.measurement_time_us()//1000) # first sample
+
+    def set_forced_mode(self):
+        self._write8(0xF4, self._ctrl_meas(0))
+        self._write8(0xF5, self.iir<<2)
+        self.normal = False
+        self._sample = None
+
+    def read_raw_data(self):
+        if not self.normal:
+            self._write8(0xF4, self._ctrl_meas(1))
+            sleep_ms(1+self.measurement_time_us()//1000)
+            while(self._read16(0xF3) & 0x08):
+                sleep_ms(1)
+        d = self._data
+        self.i2c.readfrom_mem_into(self.addr, 0xF7, d) # press, temp and hum in one burst
+        raw_p = ((d[0]<<16)|(d[1]<<8)|d[2])>>4
+        raw_t = ((d[3]<<16)|(d[4]<<8)|d[5])>>4
+        raw_h = (d[6]<<8)|d[7]
         return (raw_t, raw_p, raw_h)
 
     def read_compensated_data(self):
+        if self._sample is not None and self.max_age_ms > 0:
+            if ticks_diff(ticks_us(), self._sample_time) < self.max_age_ms*1000:
+                return self._sample
         try:
             raw_t, raw_p, raw_h = self.read_raw_data()
         except:
             print(i2c_err_str.format(self.addr))
             return (float('NaN'), float('NaN'), float('NaN'))
-        var1 = ((raw_t>>3)-(self._T1<<1))*(self._T2>>11)
+        if self.compensation == 'float':
+            self._sample = self._compensate_float(raw_t, raw_p, raw_h)
+        elif self.compensation == 'int32':
+            self._sample = self._compensate_int32(raw_t, raw_p, raw_h)
+        else:
+            self._sample = self._compensate_int(raw_t, raw_p, raw_h)
+        self._sample_time = ticks_us()
+        return self._sample
+
+    def _compensate_int(self, raw_t, raw_p, raw_h):
+        var1 = (((raw_t>>3)-(self._T1<<1))*self._T2)>>11
         var2 = (raw_t >> 4)-self._T1
         var2 = var2*((raw_t>>4)-self._T1)
         var2 = ((var2>>12)*self._T3)>>14
@@ -128,6 +224,79 @@ class PiicoDev_BME280:
         humi = h>>12
         return (temp, pres, humi)
 
+    def _compensate_float(self, raw_t, raw_p, raw_h):
+        # Same units as _compensate_int (degC*100, Pa*256, %RH*1024) without 64-bit integers
+        T1, T2, T1b, T3 = self._fT
+        v = raw_t/131072.0 - T1b
+        t_fine = (raw_t/16384.0 - T1)*T2 + v*v*T3
+        self._t_fine = t_fine
+        temp = t_fine/51.2
+        P1, P2, P3, P4, P5, P6, P7, P8, P9 = self._fP
+        var1 = t_fine*0.5 - 64000.0
+        var2 = (var1*var1*P6 + var1*P5)*0.25 + P4
+        var1 = (1.0 + (P3*var1*var1 + P2*var1)/32768.0)*P1
+        if var1 == 0:
+            pres = 0.0
+        else:
+            p = (1048576.0 - raw_p - var2/4096.0)*6250.0/var1
+            pres = (p + (P9*p*p + P8*p + P7))*256.0
+        H1, H2, H3, H4, H5, H6 = self._fH
+        h = t_fine - 76800.0
+        h = (raw_h - (H4 + H5*h))*(H2*(1.0 + H6*h*(1.0 + H3*h)))
+        h = h*(1.0 - H1*h)
+        h = 0.0 if h < 0.0 else h
+        h = 100.0 if h > 100.0 else h
+        return (temp, pres, h*1024.0)
+
+    def _compensate_int32(self, raw_t, raw_p, raw_h):
+        # Same units as _compensate_int, from the datasheet 32-bit formulas rearranged so
+        # every intermediate stays a small int for readings in the operating range: no
+        # heap allocation per sample on MicroPython. Temperature and humidity match
+        # _compensate_int exactly; pressure has 1 Pa resolution, with two more fraction
+        # bits kept in the divisor than the datasheet (within 2 Pa of _compensate_int)
+        T1 = self._T1
+        t_fine = (_mulshr((raw_t>>3)-(T1<<1), self._T2, 11)+
+                  _mulshr(_mulshr((raw_t>>4)-T1, (raw_t>>4)-T1, 12), self._T3, 14))
+        self._t_fine = t_fine
+        temp = (t_fine*5+128)>>8
+        P1, P2, P3, P4, P5, P6 = self._P1, self._P2, self._P3, self._P4, self._P5, self._P6
+        var1 = (t_fine>>1)-64000
+        sq = _mulshr(var1>>2, var1>>2, 11)
+        # var2>>12 of the datasheet: ((sq*P6 + var1*P5*2)>>14) + P4*16, in 10-bit limbs
+        var2 = ((((sq>>10)*P6+(var1>>10)*P5*2)+
+                 (((sq&1023)*P6+(var1&1023)*P5*2)>>10))>>4)+(P4<<4)
+        # ((P3*(sq>>2))>>3) + ((P2*var1)>>1), then >>16 (the datasheet's >>18, in
+        # quarters), in limbs
+        sq = sq>>2
+        var1 = (((P3*(sq>>10))+((P2*(var1>>10))<<2))+
+                ((((P3*(sq&1023))>>3)+((P2*(var1&1023))>>1))>>7))>>9
+        var1 = _mulshr(131072+var1, P1, 15)
+        if var1 == 0:
+            pres = 0
+        else:
+            # p*25000//var1, ie. p*6250 over the datasheet's var1, one digit group at a time
+            p = (1048576-raw_p)-var2
+            q = p//var1
+            p = (p-q*var1)*25
+            r = p//var1
+            p = q*25000+r*1000+((p-r*var1)*1000)//var1
+            var1 = _mulshr(((p>>3)*(p>>3))>>13, self._P9, 12)
+            var2 = _mulshr(p>>2, self._P8, 13)
+            pres = (p+((var1+var2+self._P7)>>4))<<8
+        h = t_fine-76800
+        H5 = self._H5
+        a = ((((raw_h-(self._H4<<6))<<4)-H5*(h>>10))+((16384-H5*(h&1023))>>10))>>5
+        b = _mulshr((h*self._H6)>>10, ((h*self._H3)>>11)+32768, 10)+2097152
+        b = ((b>>10)*self._H2+(((b&1023)*self._H2+8192)>>10))>>4
+        if (a > 0) != (b > 0):
+            return (temp, pres, 0) # a*b <= 0, clamped to 0 below 0 %RH
+        h = a*b
+        h = h-(((((h>>15)*(h>>15))>>7)*self._H1)>>4)
+        h = 0 if h < 0 else h
+        h = 419430400 if h>419430400 else h
+        humi = h>>12
+        return (temp, pres, humi)
+
     def values(self):
         temp, pres, humi = self.read_compensated_data()
         return (temp/100, pres/256,  humi/1024)
@@ -138,6 +307,19 @@ class PiicoDev_BME280:
         pd = (p % 256)/256
         return (pi, pd)
 
+    def _altitude(self, pi, pd, pressure_sea_level):
+        return 44330*(1-((float(pi+pd)/100)/pressure_sea_level)**(1/5.255))
+
     def altitude(self, pressure_sea_level=1013.25):
         pi, pd = self.pressure_precision()
-        return 44330*(1-((float(pi+pd)/100)/pressure_sea_level)**(1/5.255))
+        return self._altitude(pi, pd, pressure_sea_level)
+
+    def sample(self, pressure_sea_level=None):
+        # Temperature [degC], pressure [Pa], humidity [%RH] and altitude [m] from one conversion
+        if pressure_sea_level is None:
+            pressure_sea_level = self.pressure_sea_level
+        temp, pres, humi = self.read_compensated_data()
+        if pres != pres: # NaN, sensor unreachable
+            return AtmoReading(temp, pres, humi, pres)
+        alt = self._altitude(float(pres // 256), (pres % 256)/256, pressure_sea_level)
+        return AtmoReading(temp/100, pres/256, humi/1024, alt)
@@ -55,6 +55,7 @@ class PiicoDev_QMC6310(object):
         except:
             print(compat_str)
         self.i2c = create_unified_i2c(bus=bus, freq=freq, sda=sda, scl=scl)
+        self._batch = self.i2c.batch() # reused by read(), with its own buffers
         self.addr = addr
         self.odr = odr
         self.calibrationFile = calibrationFile
@@ -128,20 +129,18 @@ class PiicoDev_QMC6310(object):
         self._dataValid = False
         NaN = {'x':float('NaN'),'y':float('NaN'),'z':float('NaN')}
         try:
-            status = int.from_bytes(self.i2c.readfrom_mem(self.addr, _ADDRESS_STATUS, 1), 'big')
+            with self._batch as b: # status and all three axes in one transaction
+                st = b.read(self.addr, _ADDRESS_STATUS, 1)
+                xyz = b.read(self.addr, _ADDRESS_XOUT, 6)
+            status = st[0]
         except:
             print(i2c_err_str.format(self.addr))
             self.sample = NaN
             return NaN
         if self._getStatusReady(status) is True:
-            try:
-                x = int.from_bytes(self.i2c.readfrom_mem(self.addr, _ADDRESS_XOUT, 2), 'little')
-                y = int.from_bytes(self.i2c.readfrom_mem(self.addr, _ADDRESS_YOUT, 2), 'little')
-                z = int.from_bytes(self.i2c.readfrom_mem(self.addr, _ADDRESS_ZOUT, 2), 'little')
-            except:
-                print(i2c_err_str.format(self.addr))
-                self.sample = NaN
-                return self.sample
+            x = int.from_bytes(xyz[0:2], 'little')
+            y = int.from_bytes(xyz[2:4], 'little')
+            z = int.from_bytes(xyz[4:6], 'little')
             if self._getStatusOverflow(status) is True:
 #                 print('Overflow')
                 return NaN
@@ -33,13 +33,13 @@ def main():
         display.refresh()
     display.line_pos = [0, 15, 27, 39, 51]
     while True:
-        # Retrieve data
-        tempC, presPa, humRH = sensor.values()
+        # Retrieve data (one conversion for all four readings)
+        reading = sensor.sample()
         heading = "---Atmo Sensor---"
-        temp = "TMP: " + str(tempC) + chr(176) + "C"
-        pres = "PRE: " + str(presPa / 100) + "hPa"
-        hum = "HUM: " + str(round(humRH, 2)) + "%RH"
-        alt = "ALT: " + str(round(sensor.altitude() - zero, 2)) + "m"
+        temp = "TMP: " + str(reading.temperature) + chr(176) + "C"
+        pres = "PRE: " + str(reading.pressure / 100) + "hPa"
+        hum = "HUM: " + str(round(reading.humidity, 2)) + "%RH"
+        alt = "ALT: " + str(round(reading.altitude - zero, 2)) + "m"
 
         # Display data
         display.data = [heading, temp, pres, hum, alt]
@@ -11,10 +11,30 @@ Created: 21/05/2023
 
 Requires: Raspberry Pi Pico W with Micropython
 """
-import network
-import socket
 import time
-from machine import Pin
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+try:
+    import network
+    from machine import Pin
+except ImportError:
+    # Not on a Pico W: serve locally with a stand-in LED, so the server
+    # can be run and load-tested with CPython
+    network = None
+
+    class Pin:
+        OUT = 1
+
+        def __init__(self, pin, mode):
+            pass
+
+        def on(self):
+            pass
+
+        def off(self):
+            pass
 
 __author__ = "Sam Rogers"
 __version__ = 1.0
@@ -25,6 +45,19 @@ DEFAULT_WIFI = {
     "pwd": "systemic"
 }
 
+# Longest wait in seconds for a client's request line, and then for
+# the rest of its request
+READ_TIMEOUT = 5
+
+# Longest wait in seconds for the next request on a kept-alive connection
+KEEP_ALIVE_S = 5
+
+# Most requests served on one connection before it is closed
+MAX_REQUESTS = 100
+
+# Most header lines read from one request
+MAX_HEADERS = 32
+
 # Basic HTML Page
 HTML = """<!DOCTYPE html>
 <html>
@@ -66,39 +99,185 @@ def create_access_point(ssid, pwd):
     print("  DNS Server:\t", status[3])
 
 
-def http_server():
+class HTTPError(Exception):
     """
-    Creates a simple HTTP server.
+    A request that is answered with an error status, then the connection
+    closed. The argument is the status code and reason.
     """
-    # Listen for connections on port 80 (HTTP Server Port)
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    sock = socket.socket()
-    sock.bind(addr)
-    sock.listen(1)
 
+
+async def read_request(reader, timeout: float = READ_TIMEOUT) -> tuple:
+    """
+    Read a client's request line and headers, and discard any body, so
+    the next request on the connection starts at its request line. Gives
+    up if the request line takes longer than the timeout, or the rest of
+    the request READ_TIMEOUT.
+
+    :param reader: the client's stream reader
+    :param timeout: the longest wait in seconds for the request line
+    :return: the request line, empty if the client sent nothing, and
+             whether the client wants the connection kept open
+    :raises ValueError: if the request is not UTF-8 or its Content-Length
+                        is not a number
+    :raises HTTPError: if the rest of the request is too slow, or has more
+                       than MAX_HEADERS headers
+    """
+    request = await asyncio.wait_for(reader.readline(), timeout)
+    if not request:
+        return "", False
+    # HTTP/1.1 connections persist unless closed, HTTP/1.0 ones must ask
+    try:
+        keep_alive = await asyncio.wait_for(
+            _read_headers(reader, b"HTTP/1.1" in request), READ_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPError("408 Request Timeout")
+    return request.decode("utf-8"), keep_alive
+
+
+async def _read_headers(reader, keep_alive: bool) -> bool:
+    """
+    Read the headers of a request and discard its body.
+
+    :param reader: the client's stream reader
+    :param keep_alive: whether the request line keeps the connection open
+    :return: whether the client wants the connection kept open
+    """
+    length = 0
+    for i in range(MAX_HEADERS + 1):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        header = line[:18].lower()
+        if header[:11] == b"connection:":
+            value = line.lower()
+            keep_alive = b"keep-alive" in value or \
+                (keep_alive and b"close" not in value)
+        elif header[:15] == b"content-length:":
+            length = int(line[15:].decode())
+            if length < 0:
+                raise ValueError("negative Content-Length")
+        elif header == b"transfer-encoding:":
+            length = -1
+    else:
+        raise HTTPError("431 Request Header Fields Too Large")
+    if length < 0:
+        # The end of the body is unknown, so the connection cannot be reused
+        keep_alive = False
+    while length > 0:
+        chunk = await reader.read(min(length, 512))
+        if not chunk:
+            break
+        length -= len(chunk)
+    return keep_alive
+
+
+def response_head(content_type: str, length: int, keep_alive: bool,
+                  status: str = "200 OK") -> bytes:
+    """
+    Build the status line and headers of an HTTP/1.1 response.
+
+    :param content_type: the MIME type of the body
+    :param length: the length of the body in bytes
+    :param keep_alive: whether the connection stays open afterwards
+    :param status: the response status code and reason
+    :return: the encoded response head
+    """
+    return ("HTTP/1.1 " + status +
+            "\r\nContent-Type: " + content_type +
+            "\r\nContent-Length: " + str(length) +
+            ("\r\nConnection: keep-alive\r\nKeep-Alive: timeout=" +
+             str(KEEP_ALIVE_S) if keep_alive else "\r\nConnection: close") +
+            "\r\n\r\n").encode()
+
+
+def send_response(writer, body: bytes, content_type: str = "text/html",
+                  keep_alive: bool = False, status: str = "200 OK"):
+    """
+    Write a complete response, so the client can tell where it ends and
+    reuse the connection.
+
+    :param writer: the client's stream writer
+    :param body: the encoded response body
+    :param content_type: the MIME type of the body
+    :param keep_alive: whether the connection stays open afterwards
+    :param status: the response status code and reason
+    """
+    writer.write(response_head(content_type, len(body), keep_alive, status))
+    writer.write(body)
+
+
+async def send_error(writer, status: str):
+    """
+    Answer a request that cannot be served, before the connection is
+    closed.
+
+    :param writer: the client's stream writer
+    :param status: the response status code and reason
+    """
+    try:
+        send_response(writer, status.encode(), "text/plain", status=status)
+        await writer.drain()
+    except OSError:
+        pass
+
+
+async def http_server(port: int = 80):
+    """
+    Creates a simple HTTP server. Each client is served in its own task,
+    so a slow client does not hold up the others.
+
+    :param port: the port to listen on
+    """
     # Using on-board LED to indicate connection status
     led = Pin("LED", Pin.OUT)
     led.off()
+    clients = 0
 
-    # Listen for connections, respond to client requests
-    while True:
+    async def handle_client(reader, writer):
+        """
+        Respond to each of a client's requests with simple HTML page to
+        be displayed, until it closes the connection, it is idle for
+        KEEP_ALIVE_S or it has made MAX_REQUESTS requests.
+        """
+        nonlocal clients
+        clients += 1
+        led.on()
         try:
-            # Accept client connections and print requests to console.
-            cl, addr = sock.accept()
-            print("Client connected from: ", addr)
-            request = cl.recv(1024)
-            led.on()
-            print(request.decode("utf-8"))
-
-            # Respond to clients with simple HTML page to be displayed.
-            cl.send('HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n')
-            cl.send(HTML)
-            cl.close()
-            led.off()
-        except OSError as e:
-            # Client loses connection to server.
-            cl.close()
+            print("Client connected from: ", writer.get_extra_info("peername"))
+            timeout = READ_TIMEOUT
+            for served in range(1, MAX_REQUESTS + 1):
+                request, keep_alive = await read_request(reader, timeout)
+                if not request:
+                    break
+                print(request)
+                keep_alive = keep_alive and served < MAX_REQUESTS
+                send_response(writer, HTML.encode(), keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+                timeout = KEEP_ALIVE_S
+        except HTTPError as e:
+            await send_error(writer, e.args[0])
+        except (OSError, asyncio.TimeoutError):
+            # Client loses connection to server, or is too slow.
             print('Connection Closed')
+        except ValueError:
+            # Malformed request encoding or header
+            await send_error(writer, "400 Bad Request")
+        finally:
+            clients -= 1
+            if not clients:
+                led.off()
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    # Listen for connections on port 80 (HTTP Server Port)
+    await asyncio.start_server(handle_client, "0.0.0.0", port)
+    while True:
+        await asyncio.sleep(3600)
 
 
 def main():
@@ -106,10 +285,14 @@ def main():
     Main Loop
 
     Configures the Raspberry Pi Pico W as an access point and setups a
-    simple HTTP server to respond to connections.
+    simple HTTP server to respond to connections. Off the Pico W, the
+    server runs on port 8080 for local testing.
     """
+    if network is None:
+        asyncio.run(http_server(8080))
+        return
     create_access_point(DEFAULT_WIFI["ssid"], DEFAULT_WIFI["pwd"])
-    http_server()
+    asyncio.run(http_server())
 
 
 if __name__ == '__main__':